@@ -0,0 +1,205 @@
+"""SQLite-backed stand-in for the supabase client used by the benchmarks.
+
+Implements the part of the PostgREST query builder the app uses —
+table().select().eq()/in_()/gte()/lte().order().limit()/range().execute()
+and upsert() — with PostgREST's db-max-rows cap and optional per-request
+latency, so helpers run unchanged against it. `FakeSupabase.aio()` is the
+matching AsyncClient stand-in (awaitable execute()).
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+from postgrest.exceptions import APIError
+
+class FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+class FakeQuery:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.where = []
+        self.params = []
+        self.order_by = []
+        self.offset = 0
+        self.limit_n = None
+        self.count = None
+        self.columns = None
+        self.payload = None
+        self.on_conflict = None
+        self.returning = "representation"
+        self.ignore_duplicates = False
+
+    # ---- FILTERS ----
+    def _filter(self, col, op, value):
+        self.where.append(f'"{col}" {op} ?')
+        self.params.append(value)
+        return self
+
+    def eq(self, col, value):
+        return self._filter(col, "=", value)
+
+    def neq(self, col, value):
+        return self._filter(col, "!=", value)
+
+    def gt(self, col, value):
+        return self._filter(col, ">", value)
+
+    def gte(self, col, value):
+        return self._filter(col, ">=", value)
+
+    def lt(self, col, value):
+        return self._filter(col, "<", value)
+
+    def lte(self, col, value):
+        return self._filter(col, "<=", value)
+
+    def in_(self, col, values):
+        values = list(values)
+        self.where.append(f'"{col}" IN ({",".join("?" * len(values))})' if values else "0")
+        self.params += values
+        return self
+
+    # ---- SHAPING ----
+    def select(self, *cols, count=None):
+        names = [c.strip() for c in ",".join(cols).split(",") if c.strip()]
+        self.columns = None if not names or "*" in names else names
+        self.count = count
+        return self
+
+    def order(self, col, desc=False, **kwargs):
+        self.order_by.append((col, desc))
+        return self
+
+    def limit(self, n, **kwargs):
+        self.limit_n = n
+        return self
+
+    def range(self, start, end, **kwargs):
+        self.offset = start
+        self.limit_n = end - start + 1
+        return self
+
+    def upsert(self, rows, on_conflict="", returning="representation", ignore_duplicates=False, **kwargs):
+        self.payload = rows if isinstance(rows, list) else [rows]
+        self.on_conflict = [c.strip() for c in on_conflict.split(",") if c.strip()]
+        self.returning = returning
+        self.ignore_duplicates = ignore_duplicates
+        return self
+
+    def execute(self):
+        self.db.requests += 1
+        if self.db.latency:
+            time.sleep(self.db.latency)
+        with self.db.lock:
+            if self.payload is not None:
+                return self.db._upsert(self.table, self.payload, self.on_conflict, self.returning,
+                                       self.ignore_duplicates)
+            return self.db._select(self)
+
+class AsyncFakeQuery(FakeQuery):
+    async def execute(self):
+        self.db.requests += 1
+        if self.db.latency:
+            await asyncio.sleep(self.db.latency)
+        with self.db.lock:
+            if self.payload is not None:
+                return self.db._upsert(self.table, self.payload, self.on_conflict, self.returning,
+                                       self.ignore_duplicates)
+            return self.db._select(self)
+
+class AsyncFakeSupabase:
+    def __init__(self, db):
+        self.db = db
+
+    def table(self, name):
+        return AsyncFakeQuery(self.db, name)
+
+class FakeSupabase:
+    """In-memory (or on-disk, via `path`) SQLite database behind a supabase-like API."""
+
+    def __init__(self, path=":memory:", latency=0.0, max_rows=1000):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        self.latency = latency
+        self.max_rows = max_rows
+        self.requests = 0
+        self.columns = {}      # table -> [column, ...]
+        self.indexes = set()
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, fn, params=None):
+        """No database functions are deployed; PostgREST answers PGRST202."""
+        raise APIError({"code": "PGRST202", "message": f"Could not find the function public.{fn}"})
+
+    def aio(self):
+        """Async view of the same database."""
+        return AsyncFakeSupabase(self)
+
+    def _ensure(self, table, row, key_cols):
+        cols = self.columns.get(table)
+        if cols is None:
+            def kind(v):
+                return "INTEGER" if isinstance(v, int) else "REAL" if isinstance(v, float) else "TEXT"
+            defs = ", ".join(f'"{c}" {kind(v)}' for c, v in row.items())
+            self.conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({defs})')
+            cols = self.columns[table] = list(row)
+        for c in row:
+            if c not in cols:
+                self.conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{c}"')
+                cols.append(c)
+        if key_cols:
+            self._index(table, key_cols, unique=True)
+
+    def _index(self, table, cols, unique=False):
+        name = f"{table}__{'__'.join(cols)}"
+        if name not in self.indexes:
+            quoted = ", ".join(f'"{c}"' for c in cols)
+            kind = "UNIQUE INDEX" if unique else "INDEX"
+            self.conn.execute(f'CREATE {kind} IF NOT EXISTS "{name}" ON "{table}" ({quoted})')
+            self.indexes.add(name)
+
+    def _upsert(self, table, rows, key_cols, returning, ignore_duplicates=False):
+        if not rows:
+            return FakeResponse([])
+        self._ensure(table, rows[0], key_cols)
+        cols = list(rows[0])
+        quoted = ", ".join(f'"{c}"' for c in cols)
+        sql = f'INSERT INTO "{table}" ({quoted}) VALUES ({",".join("?" * len(cols))})'
+        if key_cols:
+            updates = ", ".join(f'"{c}" = excluded."{c}"' for c in cols if c not in key_cols)
+            sql += f' ON CONFLICT ({", ".join(key_cols)}) DO ' + (
+                f"UPDATE SET {updates}" if updates and not ignore_duplicates else "NOTHING")
+        self.conn.executemany(sql, [[r.get(c) for c in cols] for r in rows])
+        self.conn.commit()
+        return FakeResponse([] if returning == "minimal" else rows)
+
+    def _select(self, q):
+        if q.table not in self.columns:
+            return FakeResponse([], 0 if q.count else None)
+        where = f" WHERE {' AND '.join(q.where)}" if q.where else ""
+        count = None
+        if q.count:
+            count = self.conn.execute(f'SELECT COUNT(*) FROM "{q.table}"{where}', q.params).fetchone()[0]
+        cols = ", ".join(f'"{c}"' for c in q.columns) if q.columns else "*"
+        sql = f'SELECT {cols} FROM "{q.table}"{where}'
+        if q.order_by:
+            # A real deployment indexes what it sorts on; so does the stand-in
+            self._index(q.table, [c for c, _ in q.order_by])
+            sql += " ORDER BY " + ", ".join(f'"{c}"' + (" DESC" if d else "") for c, d in q.order_by)
+        limit = self.max_rows if q.limit_n is None else min(q.limit_n, self.max_rows)
+        sql += f" LIMIT {limit} OFFSET {q.offset}"
+        data = [dict(r) for r in self.conn.execute(sql, q.params)]
+        return FakeResponse(data, count)
+
+    def seed(self, table, df, key_cols):
+        """Bulk-load a DataFrame into `table` without per-request latency."""
+        records = df.to_dict("records")
+        with self.lock:
+            self._upsert(table, records, key_cols, "minimal")
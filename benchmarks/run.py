@@ -0,0 +1,294 @@
+"""Offline benchmarks for the import, duplicate-check, Dashboard and WhatsApp paths.
+
+    python -m benchmarks.run                       # 1k, 100k and 1M rows
+    python -m benchmarks.run --sizes 1k,100k --latency 0.05
+    python -m benchmarks.run --only dup_check --compare
+
+Data lives in a FakeSupabase (SQLite, in memory unless --db is given).
+Pages are executed headlessly with Streamlit's AppTest. Each run is saved as
+JSON under --out and compared with the previous run (or --compare FILE).
+"""
+import argparse
+import json
+import logging
+import math
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+
+from benchmarks.fake_supabase import FakeSupabase
+from utils import perf
+import utils.supabase_helpers as helpers
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / ".cache" / "benchmarks"
+BENCHMARKS = ["csv_import", "csv_reimport", "dup_check", "dashboard", "whatsapp"]
+DEFAULT_SIZES = "1k,100k,1M"
+ROWS_PER_BRAND = 1000          # ~3 years of daily rows; bigger sizes add brands
+REGRESSION_THRESHOLD = 0.10    # flag runs more than 10% slower than the baseline
+PAGE_TIMEOUT = 1800            # seconds allowed for one headless page run
+
+# ---- SYNTHETIC DATA ----
+SCHEMAS = {
+    "ga_traffic":     ["users"],
+    "ads_metrics":    ["clicks", "impressions"],
+    "agent_postings": ["total_listings", "sale_listings", "rent_listings", "auction_listings"],
+    "google_index":   ["indexed"],
+    "semrush_rank":   ["rank"],
+    "bounce_rate":    ["bounce_rate"],
+}
+
+def parse_size(text):
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+def brands_for(n):
+    count = max(2, math.ceil(n / ROWS_PER_BRAND))
+    return ["FindHouse", "CheckValue"] + [f"Brand{i:04d}" for i in range(3, count + 1)]
+
+def make_rows(table, n, seed=0):
+    """`n` rows of `table`: every brand gets a run of consecutive days (weeks for
+    bounce_rate) ending today."""
+    rng = np.random.default_rng(seed)
+    brands = brands_for(n)
+    per_brand = math.ceil(n / len(brands))
+    i = np.arange(n)
+    step = 7 if table == "bounce_rate" else 1
+    days = pd.to_datetime(date.today()) - pd.to_timedelta((i % per_brand) * step, unit="D")
+    df = pd.DataFrame({"brand": np.asarray(brands)[i // per_brand]})
+    if table == "ga_traffic":
+        df["start_date"] = (days - pd.Timedelta(days=6)).strftime("%Y-%m-%d")
+        df["end_date"] = days.strftime("%Y-%m-%d")
+    elif table == "bounce_rate":
+        df["week_start"] = (days - pd.Timedelta(days=6)).strftime("%Y-%m-%d")
+        df["week_end"] = days.strftime("%Y-%m-%d")
+    else:
+        df["date"] = days.strftime("%Y-%m-%d")
+    for col in SCHEMAS[table]:
+        if table == "bounce_rate":
+            df[col] = rng.uniform(20, 80, n).round(2)
+        else:
+            df[col] = rng.integers(1, 100_000, n)
+    return df
+
+def new_database(args, seeds):
+    """Fresh FakeSupabase holding `seeds` ({table: DataFrame}), latency applied afterwards."""
+    if args.db != ":memory:":
+        Path(args.db).unlink(missing_ok=True)
+    db = FakeSupabase(args.db)
+    for table, df in seeds.items():
+        db.seed(table, df, helpers.TABLE_KEYS[table])
+    db.latency = args.latency
+    db.requests = 0
+    return db
+
+def reset_helpers(db, scratch):
+    """Point the helpers at `db` and drop every in-process cache and replica."""
+    helpers.get_supabase = lambda: db
+    helpers.get_async_supabase = db.aio
+    helpers.SNAPSHOT_DIR = Path(scratch) / "snapshots"
+    perf.METRICS_FILE = Path(scratch) / "metrics.prom"
+    helpers.clear_read_cache()
+    helpers._synced.clear()
+    helpers._pending_writes.clear()
+    helpers._rollups.clear()
+    helpers._key_indexes.clear()
+    helpers._jobs.clear()
+
+def wait_for_refreshes(timeout=PAGE_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while helpers.refreshes_running() and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+def run_page(name):
+    """Execute pages/<name> headlessly as a logged-in user; returns seconds."""
+    at = AppTest.from_file(str(ROOT / "pages" / name), default_timeout=PAGE_TIMEOUT)
+    at.session_state["logged_in"] = True
+    t0 = time.perf_counter()
+    at.run()
+    seconds = time.perf_counter() - t0
+    if at.exception:
+        raise RuntimeError(f"{name} failed: {at.exception[0].message}")
+    return seconds
+
+def warm_up(args, scratch):
+    """Run each page once against an empty database so imports aren't timed."""
+    reset_helpers(new_database(args, {}), scratch)
+    for name in ("1_Dashboard.py", "Whatsapp_Blast.py"):
+        run_page(name)
+
+# ---- BENCHMARKS ----
+def bench_csv_import(args, n, scratch):
+    """Streaming CSV import of ads_metrics in keep mode; half the rows already exist."""
+    table = "ads_metrics"
+    rows = make_rows(table, n)
+    db = new_database(args, {table: rows.iloc[::2]})
+    reset_helpers(db, scratch)
+    path = Path(scratch) / "import.csv"
+    rows.to_csv(path, index=False)
+
+    t0 = time.perf_counter()
+    totals = helpers.import_chunks(pd.read_csv(path, chunksize=helpers.CSV_CHUNK_ROWS),
+                                   **helpers.import_spec(table), mode="keep")
+    seconds = time.perf_counter() - t0
+    return [{"bench": "csv_import", "rows": n, "seconds": seconds, "written": totals["written"],
+             "skipped": totals["skipped"], "requests": db.requests}]
+
+def bench_csv_reimport(args, n, scratch):
+    """Streaming re-import of an n-row ads_metrics export in diff mode; 1% of rows changed."""
+    table = "ads_metrics"
+    rows = make_rows(table, n)
+    db = new_database(args, {table: rows})
+    reset_helpers(db, scratch)
+    path = Path(scratch) / "reimport.csv"
+    changed = rows.copy()
+    changed.loc[changed.index[::100], "clicks"] += 1
+    changed.to_csv(path, index=False)
+
+    t0 = time.perf_counter()
+    totals = helpers.import_chunks(pd.read_csv(path, chunksize=helpers.CSV_CHUNK_ROWS),
+                                   **helpers.import_spec(table), mode="diff")
+    seconds = time.perf_counter() - t0
+    return [{"bench": "csv_reimport", "rows": n, "seconds": seconds, "written": totals["written"],
+             "skipped": totals["skipped"], "requests": db.requests}]
+
+def bench_dup_check(args, n, scratch):
+    """query_duplicates for n keys against an n-row table; half of them exist.
+
+    Cold loads the key index; warm is a rerun (e.g. after a cell edit) with
+    the index in memory and no replica.
+    """
+    table, key_cols = "ads_metrics", helpers.TABLE_KEYS["ads_metrics"]
+    rows = make_rows(table, n)
+    db = new_database(args, {table: rows.iloc[::2]})
+    reset_helpers(db, scratch)
+    results = []
+    for phase in ("", "_warm"):
+        db.requests = 0
+        t0 = time.perf_counter()
+        found = helpers.query_duplicates(table, rows[key_cols], key_cols)
+        seconds = time.perf_counter() - t0
+        results.append({"bench": f"dup_check{phase}", "rows": n, "seconds": seconds,
+                        "found": len(found), "requests": db.requests})
+    return results
+
+def bench_dashboard(args, n, scratch):
+    """Dashboard page run: cold (full download), from snapshot, and warm (replicas in memory)."""
+    db = new_database(args, {t: make_rows(t, n) for t in SCHEMAS})
+    reset_helpers(db, scratch)
+    results = []
+    for phase in ("cold", "snapshot", "warm"):
+        if phase == "snapshot":
+            helpers._synced.clear()
+            helpers._rollups.clear()
+        db.requests = 0
+        seconds = run_page("1_Dashboard.py")
+        results.append({"bench": f"dashboard_{phase}", "rows": n, "seconds": seconds,
+                        "requests": db.requests})
+        wait_for_refreshes()
+    return results
+
+def bench_whatsapp(args, n, scratch):
+    """WhatsApp Blast page run with a cold read cache."""
+    tables = ["ga_traffic", "ads_metrics", "agent_postings", "google_index", "bounce_rate"]
+    db = new_database(args, {t: make_rows(t, n) for t in tables})
+    reset_helpers(db, scratch)
+    seconds = run_page("Whatsapp_Blast.py")
+    return [{"bench": "whatsapp", "rows": n, "seconds": seconds, "requests": db.requests}]
+
+# ---- RESULTS ----
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def save_results(results, args):
+    args.out.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    path = args.out / f"{stamp}.json"
+    meta = {"time": stamp, "commit": git_commit(), "python": platform.python_version(),
+            "latency": args.latency, "db": args.db, "repeat": args.repeat}
+    path.write_text(json.dumps({"meta": meta, "results": results}, indent=2))
+    return path
+
+def previous_results(args, current):
+    runs = sorted(p for p in args.out.glob("*.json") if p != current)
+    return runs[-1] if runs else None
+
+def compare(results, baseline_path, threshold):
+    """Print each result next to the baseline's; returns the number of regressions."""
+    baseline = json.loads(Path(baseline_path).read_text())
+    before = {(r["bench"], r["rows"]): r["seconds"] for r in baseline["results"]}
+    print(f"\nvs {baseline_path} (commit {baseline['meta'].get('commit')}):")
+    regressions = 0
+    for r in results:
+        old = before.get((r["bench"], r["rows"]))
+        if old is None:
+            continue
+        change = (r["seconds"] - old) / old if old else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  ⚠️ regression"
+            regressions += 1
+        print(f"  {r['bench']:<20} {r['rows']:>9,}  {old:9.3f}s → {r['seconds']:9.3f}s  {change:+7.1%}{flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated row counts (1k, 100k, 1M)")
+    parser.add_argument("--only", default=",".join(BENCHMARKS), help="comma-separated benchmarks to run")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--db", default=":memory:", help="SQLite path for the fake database")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per measurement (best is kept)")
+    parser.add_argument("--out", type=Path, default=RESULTS_DIR, help="directory for result files")
+    parser.add_argument("--compare", nargs="?", const="previous", default="previous",
+                        help="baseline result file (default: the previous run)")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+    # Helper threads have no ScriptRunContext under AppTest; that warning is expected
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+    benches = {"csv_import": bench_csv_import, "csv_reimport": bench_csv_reimport,
+               "dup_check": bench_dup_check, "dashboard": bench_dashboard,
+               "whatsapp": bench_whatsapp}
+    results = []
+    if {"dashboard", "whatsapp"} & set(args.only.split(",")):
+        with tempfile.TemporaryDirectory() as scratch:
+            warm_up(args, scratch)
+    for n in [parse_size(s) for s in args.sizes.split(",")]:
+        for name in args.only.split(","):
+            best = {}
+            for _ in range(args.repeat):
+                with tempfile.TemporaryDirectory() as scratch:
+                    for r in benches[name](args, n, scratch):
+                        key = r["bench"]
+                        if key not in best or r["seconds"] < best[key]["seconds"]:
+                            best[key] = r
+            for r in best.values():
+                r["rows_per_s"] = round(r["rows"] / r["seconds"]) if r["seconds"] else None
+                print(f"{r['bench']:<20} {r['rows']:>9,} rows  {r['seconds']:9.3f}s  "
+                      f"{r['requests']:>6} requests")
+                results.append(r)
+
+    path = save_results(results, args)
+    print(f"\nSaved {path}")
+    baseline = previous_results(args, path) if args.compare == "previous" else args.compare
+    if baseline and compare(results, baseline, args.threshold):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
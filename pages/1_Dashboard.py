@@ -1,8 +1,13 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
 from datetime import date, timedelta
-from utils.supabase_helpers import fetch_table, ensure_login
+from utils import perf
+from utils.supabase_helpers import (
+    sync_tables, filter_frame, make_filters, kpi_by_brand, fetch_buckets, ensure_login,
+    show_perf_panel
+)
 
 st.set_page_config(page_title="Dashboard", page_icon="📊", layout="wide")
 ensure_login()
@@ -11,6 +16,7 @@ st.title("📊 Dashboard — FTT Metrics")
 
 BRANDS = ["FindHouse", "CheckValue"]
 COLORS = {"FindHouse": "#FF4800", "CheckValue": "#48cae4"}
+GRAINS = {"Daily": None, "Weekly": "week", "Monthly": "month"}
 
 # ---------- Date Filter Init ----------
 if "date_range" not in st.session_state:
@@ -65,77 +71,141 @@ with st.expander("📆 Date Filters", expanded=False):
             st.session_state.date_range = new_range
             st.rerun()
 
+    granularity = st.radio(
+        "Granularity", list(GRAINS), horizontal=True, key="granularity",
+        help="Weekly and monthly series are aggregated by the database: sums for "
+             "clicks and impressions, latest value for listings and indexed pages, "
+             "average for rank."
+    )
+
+# ---------- Chart Options ----------
+with st.expander("📈 Chart Options", expanded=False):
+    full_res = st.toggle("Full resolution", value=False,
+                         help="Plot every data point instead of a downsampled series.")
+    point_budget = st.number_input("Max points per brand", min_value=50, max_value=5000,
+                                   value=400, step=50, disabled=full_res)
+
 # ---------- Use Date Range ----------
 start, end = st.session_state.date_range
 
 # Brand Filter
 brands = st.multiselect("🎯 Select Brands", BRANDS, default=BRANDS)
-st.caption(f"Showing data from {start} to {end}")
-
-# Fetch data from Supabase
-ga    = fetch_table("ga_traffic")
-ads   = fetch_table("ads_metrics")
-posts = fetch_table("agent_postings")
-idx   = fetch_table("google_index")
-rk    = fetch_table("semrush_rank")
-br    = fetch_table("bounce_rate")
-
-# Filter by brand & date
-def filter_range(df, date_col):
+st.caption(f"Showing data from {start} to {end} ({granularity.lower()})")
+
+# Fetch data from Supabase — local replicas, only new rows are downloaded
+frames, errors = sync_tables(["ga_traffic", "ads_metrics", "agent_postings",
+                              "google_index", "semrush_rank", "bounce_rate"])
+for name, err in errors.items():
+    st.warning(f"Could not load {name}: {err}")
+
+def _filtered(table, date_col):
+    with perf.span("dashboard.filter", table=table) as rec:
+        df = filter_frame(frames[table], make_filters(date_col, start, end, brands))
+        rec["rows"] = len(df)
+    return df
+
+ga    = _filtered("ga_traffic",     "end_date")
+ads   = _filtered("ads_metrics",    "date")
+posts = _filtered("agent_postings", "date")
+idx   = _filtered("google_index",   "date")
+rk    = _filtered("semrush_rank",   "date")
+br    = _filtered("bounce_rate",    "week_start")
+
+# Sort (rows are already filtered by brand & date and arrive with parsed dates)
+def filter_range(df, table, date_col):
     if df.empty:
         return df
-    df[date_col] = pd.to_datetime(df[date_col], errors="coerce").dt.date
-    df = df[(df[date_col] >= start) & (df[date_col] <= end) & (df["brand"].isin(brands))]
-    return df.sort_values([date_col, "brand"]).reset_index(drop=True)
+    with perf.span("dashboard.sort", table=table) as rec:
+        rec["rows"] = len(df)
+        return df.sort_values([date_col, "brand"]).reset_index(drop=True)
 
-ga    = filter_range(ga,    "end_date")
-ads   = filter_range(ads,   "date")
-posts = filter_range(posts, "date")
-idx   = filter_range(idx,   "date")
-rk    = filter_range(rk,    "date")
+ga    = filter_range(ga,    "ga_traffic",     "end_date")
+ads   = filter_range(ads,   "ads_metrics",    "date")
+posts = filter_range(posts, "agent_postings", "date")
+idx   = filter_range(idx,   "google_index",   "date")
+rk    = filter_range(rk,    "semrush_rank",   "date")
 
-# Bounce rate: filter by week_start falling within selected range
+# Bounce rate: rows already limited to week_start within selected range
 def filter_bounce(df):
     if df.empty:
         return df
-    df["week_start"] = pd.to_datetime(df["week_start"], errors="coerce").dt.date
-    df["week_end"]   = pd.to_datetime(df["week_end"],   errors="coerce").dt.date
-    df = df[(df["week_start"] >= start) & (df["week_start"] <= end) & (df["brand"].isin(brands))]
     df = df.sort_values(["week_start", "brand"]).reset_index(drop=True)
     # Create a readable week label for the x-axis
-    df["week_label"] = df.apply(
-        lambda r: f"{r['week_start'].strftime('%d/%m')}–{r['week_end'].strftime('%d/%m/%Y')}",
-        axis=1
-    )
+    df["week_label"] = df["week_start"].dt.strftime("%d/%m") + "–" + df["week_end"].dt.strftime("%d/%m/%Y")
     return df
 
 br = filter_bounce(br)
 
-# KPIs
+# KPIs — whole weeks come from the precomputed rollup, only edge days from rows
 c1, c2, c3, c4 = st.columns(4)
 if not ga.empty:
-    last = ga.groupby("brand")["users"].last()
+    last = kpi_by_brand("ga_traffic", "users", "last", start, end, ga)
     c1.metric("Users", " | ".join([f"{b}: {int(v):,}" for b, v in last.items()]))
 if not ads.empty:
-    clicks = ads.groupby("brand")["clicks"].sum()
+    clicks = kpi_by_brand("ads_metrics", "clicks", "sum", start, end, ads)
     c2.metric("Clicks", " | ".join([f"{b}: {int(v):,}" for b, v in clicks.items()]))
 if not posts.empty:
-    total = posts.groupby("brand")["total_listings"].last()
+    total = kpi_by_brand("agent_postings", "total_listings", "last", start, end, posts)
     c3.metric("Listings", " | ".join([f"{b}: {int(v):,}" for b, v in total.items()]))
 if not idx.empty:
-    last_i = idx.groupby("brand")["indexed"].last()
+    last_i = kpi_by_brand("google_index", "indexed", "last", start, end, idx)
     c4.metric("Indexed Pages", " | ".join([f"{b}: {int(v):,}" for b, v in last_i.items()]))
 
 # Bounce rate KPI (latest week per brand)
 if not br.empty:
-    last_br = br.sort_values("week_start").groupby("brand").last()["bounce_rate"]
+    last_br = kpi_by_brand("bounce_rate", "bounce_rate", "last", start, end, br)
     br_str = " | ".join([f"{b}: {v:.1f}%" for b, v in last_br.items()])
     st.metric("📉 Bounce Rate (Latest Week)", br_str)
 
+# Largest-Triangle-Three-Buckets: keeps the points that shape the line
+def lttb_indices(xs, ys, n):
+    size = len(xs)
+    if n >= size or n < 3:
+        return np.arange(size)
+    edges = np.linspace(1, size - 1, n - 1).astype(int)
+    keep = [0]
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt_hi = edges[i + 2] if i + 2 < len(edges) else size
+        avg_x, avg_y = xs[hi:nxt_hi].mean(), ys[hi:nxt_hi].mean()
+        area = np.abs((xs[a] - avg_x) * (ys[lo:hi] - ys[a])
+                      - (xs[a] - xs[lo:hi]) * (avg_y - ys[a]))
+        a = lo + int(area.argmax())
+        keep.append(a)
+    keep.append(size - 1)
+    return np.asarray(keep)
+
+def downsample(df, x, y, n):
+    """LTTB-downsample each brand's series to at most `n` points."""
+    parts = []
+    for _, g in df.dropna(subset=[y]).groupby("brand", sort=False, observed=True):
+        xs = g[x].to_numpy(dtype="datetime64[ns]").astype("int64").astype(float)
+        parts.append(g.iloc[lttb_indices(xs, g[y].to_numpy(dtype=float), n)])
+    return pd.concat(parts) if parts else df
+
+# Daily charts plot the rows; weekly/monthly ones only the buckets
+grain = GRAINS[granularity]
+
+def series(table, df):
+    if grain is None or df.empty:
+        return df
+    return fetch_buckets(table, grain, start, end, brands, rows=df)
+
+ads_s   = series("ads_metrics",    ads)
+posts_s = series("agent_postings", posts)
+idx_s   = series("google_index",   idx)
+rk_s    = series("semrush_rank",   rk)
+per = "" if grain is None else f" ({granularity})"
+
 # Chart helper
-def chart(df, x, y, title, y_suffix=""):
+def chart(df, table, x, y, title, y_suffix=""):
     if df.empty:
         return
+    if not full_res:
+        with perf.span("dashboard.downsample", table=table, metric=y) as rec:
+            df = downsample(df, x, y, int(point_budget))
+            rec["rows"] = len(df)
     fig = px.line(df, x=x, y=y, color="brand", title=title,
                   color_discrete_map=COLORS, markers=True)
     if y_suffix == "%":
@@ -144,12 +214,12 @@ def chart(df, x, y, title, y_suffix=""):
 
 st.markdown("### 📈 Trends")
 
-chart(ga,    "end_date",   "users",       "Google Analytics • Users")
-chart(ads,   "date",       "clicks",      "Google Ads • Clicks")
-chart(ads,   "date",       "impressions", "Google Ads • Impressions")
-chart(posts, "date",       "total_listings", "Agent Postings • Total Listings")
-chart(idx,   "date",       "indexed",     "Google Index • Indexed Pages")
-chart(rk,    "date",       "rank",        "Semrush Rank (Lower = Better)")
+chart(ga,      "ga_traffic",     "end_date", "users",       "Google Analytics • Users")
+chart(ads_s,   "ads_metrics",    "date",     "clicks",      f"Google Ads • Clicks{per}")
+chart(ads_s,   "ads_metrics",    "date",     "impressions", f"Google Ads • Impressions{per}")
+chart(posts_s, "agent_postings", "date",     "total_listings", f"Agent Postings • Total Listings{per}")
+chart(idx_s,   "google_index",   "date",     "indexed",     f"Google Index • Indexed Pages{per}")
+chart(rk_s,    "semrush_rank",   "date",     "rank",        f"Semrush Rank (Lower = Better){per}")
 
 # Bounce rate chart — weekly x-axis with labelled week ranges
 if not br.empty:
@@ -163,3 +233,5 @@ if not br.empty:
     st.plotly_chart(fig_br, use_container_width=True)
 else:
     st.info("📉 No bounce rate data available for the selected date range.")
+
+show_perf_panel()
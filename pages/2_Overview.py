@@ -1,27 +1,97 @@
 import streamlit as st
-import pandas as pd
-from utils.supabase_helpers import fetch_table, ensure_login
+import os
+import tempfile
+from datetime import date, timedelta
+from utils.export import export_tables
+from utils.supabase_helpers import fetch_page, ensure_login, show_perf_panel
 
 st.set_page_config(page_title="Overview", page_icon="📋", layout="wide")
 ensure_login()
 
 st.title("📋 Overview — All Data Tables")
 
+SECTIONS = {
+    "Google Analytics": ("ga_traffic",     "end_date"),
+    "Google Ads":       ("ads_metrics",    "date"),
+    "Agent Postings":   ("agent_postings", "date"),
+    "Google Index":     ("google_index",   "date"),
+    "Semrush Rank":     ("semrush_rank",   "date"),
+    "📉 Bounce Rate":   ("bounce_rate",    "week_start"),
+}
+BRANDS = ["FindHouse", "CheckValue"]
+
+# Only the selected table is queried, one page at a time, newest first
+title = st.radio("Table", list(SECTIONS), horizontal=True, label_visibility="collapsed")
+table, date_col = SECTIONS[title]
+
 def show_table(title, table, date_col=None):
     st.subheader(title)
-    df = fetch_table(table)
+    c1, c2 = st.columns([1, 3])
+    page_size = c1.selectbox("Rows per page", [50, 100, 250, 500], index=1, key=f"{table}_page_size")
+    page_key = f"{table}_page"
+    if page_key not in st.session_state:
+        st.session_state[page_key] = 1
+    try:
+        df, total = fetch_page(table, st.session_state[page_key] - 1, page_size, order=date_col)
+    except Exception as e:
+        st.error(f"Error loading {table}: {e}")
+        return
+    pages = max(1, -(-total // page_size))
+    if st.session_state[page_key] > pages:
+        st.session_state[page_key] = pages
+        st.rerun()
+    c2.number_input(f"Page (of {pages:,} — {total:,} rows)", min_value=1, max_value=pages,
+                    step=1, key=page_key)
     if df.empty:
         st.info("No data found.")
     else:
-        # Sort by date column descending using pandas — avoids Supabase order param issues
-        if date_col and date_col in df.columns:
-            df[date_col] = pd.to_datetime(df[date_col], errors="coerce")
-            df = df.sort_values(date_col, ascending=False).reset_index(drop=True)
-        st.dataframe(df, use_container_width=True, hide_index=True)
-
-show_table("Google Analytics",  "ga_traffic",     date_col="end_date")
-show_table("Google Ads",        "ads_metrics",     date_col="date")
-show_table("Agent Postings",    "agent_postings",  date_col="date")
-show_table("Google Index",      "google_index",    date_col="date")
-show_table("Semrush Rank",      "semrush_rank",    date_col="date")
-show_table("📉 Bounce Rate",    "bounce_rate",     date_col="week_start")
+        # Date columns arrive as datetime64; show them without a time part
+        dates = {c: st.column_config.DatetimeColumn(format="YYYY-MM-DD")
+                 for c in df.select_dtypes("datetime").columns}
+        st.dataframe(df, use_container_width=True, hide_index=True, column_config=dates)
+
+show_table(title, table, date_col=date_col)
+
+# ---- Export ----
+# The bundle is written page by page to a temp file; the finished zip is handed
+# to the download button once, right after the build, and the file removed
+with st.expander("📦 Export tables", expanded=False):
+    picked = st.multiselect("Tables", list(SECTIONS), default=list(SECTIONS), key="export_tables")
+    c1, c2, c3 = st.columns(3)
+    fmt = c1.radio("Format", ["CSV", "Parquet"], horizontal=True, key="export_format")
+    use_dates = c2.checkbox("Filter by date", key="export_use_dates")
+    dr = c2.date_input("Date range", value=(date.today() - timedelta(days=90), date.today()),
+                       max_value=date.today(), format="YYYY-MM-DD", disabled=not use_dates,
+                       key="export_dates")
+    brands = c3.multiselect("Brands (empty = all)", BRANDS, key="export_brands")
+
+    start = end = None
+    if use_dates and isinstance(dr, (list, tuple)) and len(dr) == 2:
+        start, end = sorted(dr)
+
+    if st.button("📦 Build export", key="export_build", disabled=not picked):
+        with tempfile.NamedTemporaryFile(prefix="ftt_export_", suffix=".zip", delete=False) as tmp:
+            path = tmp.name
+        tables = [SECTIONS[t][0] for t in picked]
+        bar = st.progress(0.0, text="Exporting…")
+
+        def progress(table, rows):
+            bar.progress(tables.index(table) / len(tables), text=f"Exporting {table}… {rows:,} rows")
+
+        try:
+            counts = export_tables(path, tables, fmt.lower(), start, end, brands or None,
+                                   progress=progress)
+            bar.empty()
+            st.caption(" · ".join(f"{t}: {n:,} rows" for t, n in counts.items()))
+            stamp = date.today().strftime("%Y%m%d")
+            with open(path, "rb") as f:
+                st.download_button("⬇️ Download export", f,
+                                   file_name=f"ftt_export_{stamp}_{fmt.lower()}.zip",
+                                   mime="application/zip", key="export_download")
+        except Exception as e:
+            bar.empty()
+            st.error(f"Export failed: {e}")
+        finally:
+            os.unlink(path)
+
+show_perf_panel()
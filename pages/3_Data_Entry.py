@@ -2,7 +2,7 @@ import streamlit as st
 import pandas as pd
 from datetime import date, timedelta
 from utils.supabase_helpers import (
-    ensure_login, upsert_rows, upload_edit_import_csv_supabase
+    ensure_login, upsert_rows, upload_edit_import_csv_supabase, import_spec, show_perf_panel
 )
 
 st.set_page_config(page_title="Data Entry", page_icon="✍️", layout="wide")
@@ -31,14 +31,7 @@ with tab1:
 
     st.markdown("---")
     upload_edit_import_csv_supabase(
-        "Upload Google Analytics CSV", "ga",
-        ["brand", "start_date", "end_date", "users"],
-        ["start_date", "end_date"], ["users"],
-        "ga_traffic", ["brand", "start_date", "end_date"],
-        lambda r: {
-            "brand": r["brand"], "start_date": str(r["start_date"]),
-            "end_date": str(r["end_date"]), "users": int(r["users"])
-        }
+        "Upload Google Analytics CSV", "ga", **import_spec("ga_traffic")
     )
 
 # ---- GOOGLE ADS ----
@@ -54,14 +47,7 @@ with tab2:
 
     st.markdown("---")
     upload_edit_import_csv_supabase(
-        "Upload Google Ads CSV", "ads",
-        ["brand", "date", "clicks", "impressions"],
-        ["date"], ["clicks", "impressions"],
-        "ads_metrics", ["brand", "date"],
-        lambda r: {
-            "brand": r["brand"], "date": str(r["date"]),
-            "clicks": int(r["clicks"]), "impressions": int(r["impressions"])
-        }
+        "Upload Google Ads CSV", "ads", **import_spec("ads_metrics")
     )
 
 # ---- AGENT POSTINGS ----
@@ -83,18 +69,7 @@ with tab3:
 
     st.markdown("---")
     upload_edit_import_csv_supabase(
-        "Upload Agent Postings CSV", "posts",
-        ["brand", "date", "total_listings", "sale_listings", "rent_listings", "auction_listings"],
-        ["date"],
-        ["total_listings", "sale_listings", "rent_listings", "auction_listings"],
-        "agent_postings", ["brand", "date"],
-        lambda r: {
-            "brand": r["brand"], "date": str(r["date"]),
-            "total_listings": int(r["total_listings"]),
-            "sale_listings": int(r["sale_listings"]),
-            "rent_listings": int(r["rent_listings"]),
-            "auction_listings": int(r["auction_listings"])
-        }
+        "Upload Agent Postings CSV", "posts", **import_spec("agent_postings")
     )
 
 # ---- GOOGLE INDEX ----
@@ -109,14 +84,7 @@ with tab4:
 
     st.markdown("---")
     upload_edit_import_csv_supabase(
-        "Upload Google Index CSV", "idx",
-        ["brand", "date", "indexed"],
-        ["date"], ["indexed"],
-        "google_index", ["brand", "date"],
-        lambda r: {
-            "brand": r["brand"], "date": str(r["date"]),
-            "indexed": int(r["indexed"])
-        }
+        "Upload Google Index CSV", "idx", **import_spec("google_index")
     )
 
 # ---- SEMRUSH RANK ----
@@ -131,14 +99,7 @@ with tab5:
 
     st.markdown("---")
     upload_edit_import_csv_supabase(
-        "Upload Semrush Rank CSV", "rk",
-        ["brand", "date", "rank"],
-        ["date"], ["rank"],
-        "semrush_rank", ["brand", "date"],
-        lambda r: {
-            "brand": r["brand"], "date": str(r["date"]),
-            "rank": int(r["rank"])
-        }
+        "Upload Semrush Rank CSV", "rk", **import_spec("semrush_rank")
     )
 
 # ---- BOUNCE RATE ----
@@ -190,14 +151,7 @@ with tab6:
 
     st.markdown("---")
     upload_edit_import_csv_supabase(
-        "Upload Bounce Rate CSV", "br",
-        ["brand", "week_start", "week_end", "bounce_rate"],
-        ["week_start", "week_end"], ["bounce_rate"],
-        "bounce_rate", ["brand", "week_start"],
-        lambda r: {
-            "brand": r["brand"],
-            "week_start": str(r["week_start"]),
-            "week_end": str(r["week_end"]),
-            "bounce_rate": float(r["bounce_rate"])
-        }
+        "Upload Bounce Rate CSV", "br", **import_spec("bounce_rate")
     )
+
+show_perf_panel()
@@ -1,7 +1,9 @@
 import streamlit as st
-import pandas as pd
-from datetime import datetime
-from utils.supabase_helpers import ensure_login, get_supabase
+from utils import perf
+from utils.supabase_helpers import (
+    ensure_login, fetch_latest_many, read_refreshed, clear_read_cache, show_perf_panel
+)
+from utils.whatsapp_summary import SECTIONS, render_blocks
 
 st.set_page_config(
     page_title="Whatsapp Blast",
@@ -25,19 +27,28 @@ def format_compact(num):
     else:
         return str(num)
 
-# Fetch data from Supabase
-def fetch_data(table: str, brand: str, limit: int = None, order_by: str = "date"):
-    """Fetch data from Supabase table"""
+# Fetch data from Supabase — one query per table covers every brand, all tables at once
+def _load_latest():
+    frames, errors = fetch_latest_many(
+        {table: (table, BRANDS, LATEST_N, order_by) for _, table, order_by, _ in SECTIONS},
+        ttl=0
+    )
+    if errors:
+        # Fail the whole refresh so the last complete result keeps being served
+        table, e = next(iter(errors.items()))
+        raise RuntimeError(f"Error fetching data from {table}: {e}")
+    return frames
+
+def fetch_latest(force=False):
+    """Latest LATEST_N rows per brand of every summary table and when they were loaded.
+
+    Served from the background refresher; only the first load or `force` waits for Supabase.
+    """
     try:
-        supabase = get_supabase()
-        query = supabase.table(table).select("*").eq("brand", brand).order(order_by, desc=True)
-        if limit:
-            query = query.limit(limit)
-        response = query.execute()
-        return pd.DataFrame(response.data)
+        return read_refreshed(("whatsapp", tuple(BRANDS), LATEST_N), _load_latest, force=force)
     except Exception as e:
-        st.error(f"Error fetching data from {table}: {e}")
-        return pd.DataFrame()
+        st.error(str(e))
+        return {}, None
 
 # --- Page Header ---
 st.title("💬 Whatsapp Blast")
@@ -46,11 +57,11 @@ st.markdown("Generate printable summaries for WhatsApp marketing campaigns")
 # --- Refresh Button ---
 col1, col2, col3 = st.columns([2, 1, 1])
 with col2:
-    if st.button("🔄 Refresh Data", use_container_width=True):
+    refresh = st.button("🔄 Refresh Data", use_container_width=True)
+    if refresh:
         st.cache_data.clear()
-        st.rerun()
-with col3:
-    st.caption(f"🕐 {datetime.now().strftime('%H:%M:%S')}")
+        clear_read_cache()
+as_of_slot = col3.empty()
 
 # --- Printable Summary Section ---
 st.markdown("---")
@@ -59,67 +70,19 @@ st.subheader("🧾 Printable Summary")
 LATEST_N = 4
 
 with st.spinner("Loading latest data..."):
+    frames, as_of = fetch_latest(force=refresh)
+    if as_of:
+        as_of_slot.caption(f"🕐 Data as of {as_of.strftime('%H:%M:%S')}")
+
+    # Blocks are cached by brand, LATEST_N and data version — unchanged data renders nothing
+    with perf.span("whatsapp.render") as rec:
+        blocks = render_blocks(frames, BRANDS, LATEST_N)
+        rec["rows"] = sum(len(df) for df in frames.values())
     for brand in BRANDS:
         st.markdown(f"**{brand}**")
-        block = []
-        separator = "-" * 20
-        block.append(separator)
-        block.append(brand)
-        block.append(separator)
-
-        # Google Analytics - uses end_date for ordering
-        ga = fetch_data("ga_traffic", brand, LATEST_N, order_by="end_date")
-        if not ga.empty:
-            ga = ga.sort_values("end_date")
-            block.append("*Google Analytics*:")
-            for _, r in ga.iterrows():
-                start = pd.to_datetime(r['start_date']).strftime("%d/%m/%Y")
-                end   = pd.to_datetime(r['end_date']).strftime("%d/%m/%Y")
-                block.append(f"{start}–{end}: {int(r['users'])}")
-
-        # Google Ads
-        ads = fetch_data("ads_metrics", brand, LATEST_N, order_by="date")
-        if not ads.empty:
-            ads = ads.sort_values("date")
-            block.append("")
-            block.append("*Google Ads*:")
-            for _, r in ads.iterrows():
-                d = pd.to_datetime(r['date']).strftime("%d/%m/%Y")
-                block.append(f"{d}: [{int(r['clicks'])},{int(r['impressions'])}]")
-
-        # Agent Postings
-        posts = fetch_data("agent_postings", brand, LATEST_N, order_by="date")
-        if not posts.empty:
-            posts = posts.sort_values("date")
-            block.append("")
-            block.append("*Agent Postings*:")
-            for _, r in posts.iterrows():
-                d = pd.to_datetime(r['date']).strftime("%d/%m/%Y")
-                block.append(f"{d}: {int(r['total_listings'])} "
-                             f"[{int(r['sale_listings'])},{int(r['rent_listings'])},{int(r['auction_listings'])}]")
-
-        # Google Index
-        idx = fetch_data("google_index", brand, LATEST_N, order_by="date")
-        if not idx.empty:
-            idx = idx.sort_values("date")
-            block.append("")
-            block.append("*Google Index*:")
-            for _, r in idx.iterrows():
-                d = pd.to_datetime(r['date']).strftime("%d/%m/%Y")
-                block.append(f"{d}: {int(r['indexed'])}")
-
-        # Bounce Rate (weekly) — fetch latest weeks
-        br = fetch_data("bounce_rate", brand, LATEST_N, order_by="week_start")
-        if not br.empty:
-            br = br.sort_values("week_start")
-            block.append("")
-            block.append("*Bounce Rate*:")
-            for _, r in br.iterrows():
-                ws = pd.to_datetime(r['week_start']).strftime("%d/%m/%Y")
-                we = pd.to_datetime(r['week_end']).strftime("%d/%m/%Y")
-                block.append(f"{ws}–{we}: {float(r['bounce_rate']):.2f}%")
-
-        st.code("\n".join(block))
+        st.code(blocks[brand])
 
 st.markdown("---")
 st.info("💡 **Tip:** Click the 'Refresh Data' button above to load the latest data from the database.")
+
+show_perf_panel()
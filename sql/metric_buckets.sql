@@ -0,0 +1,81 @@
+-- Weekly / monthly buckets for the Dashboard granularity selector.
+--
+-- Run once in the Supabase SQL editor. fetch_buckets() in
+-- utils/supabase_helpers.py calls <table>_buckets over RPC and, while a
+-- function is missing, builds the same buckets from the local replica.
+-- Aggregates must match BUCKET_AGGS there; weeks start on Monday.
+--
+--   grain       'week' or 'month' (any date_trunc field works)
+--   start_date  first day of rows to include
+--   end_date    last day of rows to include
+--   brands      brands to include, null for all
+
+create or replace function ads_metrics_buckets(
+    grain text, start_date date, end_date date, brands text[] default null
+)
+returns table (brand text, date date, clicks bigint, impressions bigint)
+language sql stable
+as $$
+    select m.brand::text,
+           date_trunc(grain, m.date)::date,
+           sum(m.clicks)::bigint,
+           sum(m.impressions)::bigint
+    from ads_metrics m
+    where m.date between start_date and end_date
+      and (brands is null or m.brand = any(brands))
+    group by 1, 2
+    order by 2, 1
+$$;
+
+create or replace function agent_postings_buckets(
+    grain text, start_date date, end_date date, brands text[] default null
+)
+returns table (brand text, date date, total_listings bigint, sale_listings bigint,
+               rent_listings bigint, auction_listings bigint)
+language sql stable
+as $$
+    select m.brand::text,
+           date_trunc(grain, m.date)::date,
+           (array_agg(m.total_listings order by m.date desc))[1]::bigint,
+           (array_agg(m.sale_listings order by m.date desc))[1]::bigint,
+           (array_agg(m.rent_listings order by m.date desc))[1]::bigint,
+           (array_agg(m.auction_listings order by m.date desc))[1]::bigint
+    from agent_postings m
+    where m.date between start_date and end_date
+      and (brands is null or m.brand = any(brands))
+    group by 1, 2
+    order by 2, 1
+$$;
+
+create or replace function google_index_buckets(
+    grain text, start_date date, end_date date, brands text[] default null
+)
+returns table (brand text, date date, indexed bigint)
+language sql stable
+as $$
+    select m.brand::text,
+           date_trunc(grain, m.date)::date,
+           (array_agg(m.indexed order by m.date desc))[1]::bigint
+    from google_index m
+    where m.date between start_date and end_date
+      and (brands is null or m.brand = any(brands))
+    group by 1, 2
+    order by 2, 1
+$$;
+
+create or replace function semrush_rank_buckets(
+    grain text, start_date date, end_date date, brands text[] default null
+)
+returns table (brand text, date date, rank double precision, best_rank bigint)
+language sql stable
+as $$
+    select m.brand::text,
+           date_trunc(grain, m.date)::date,
+           avg(m.rank)::double precision,
+           min(m.rank)::bigint
+    from semrush_rank m
+    where m.date between start_date and end_date
+      and (brands is null or m.brand = any(brands))
+    group by 1, 2
+    order by 2, 1
+$$;
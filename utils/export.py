@@ -0,0 +1,132 @@
+"""Bulk export of the metric tables to a zipped CSV or Parquet bundle.
+
+Tables are paged through with iter_table_pages and each page is appended
+to its zip entry as soon as it arrives, so memory stays at a few pages
+whatever the table size. Used by the Overview page and from the command
+line:
+
+    python -m utils.export backup.zip --format parquet --start 2025-01-01 --brands FindHouse
+"""
+import argparse
+import json
+import sys
+import time
+import zipfile
+from datetime import datetime, timezone
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils import perf
+from utils.supabase_helpers import (
+    PAGE_SIZE, TABLE_KEYS, TABLE_SCHEMAS, WATERMARK_COLS, iter_table_pages, make_filters
+)
+
+EXPORT_TABLES = list(TABLE_KEYS)
+EXPORT_FORMATS = ("csv", "parquet")
+
+def _arrow_schema(table, columns):
+    """Fixed Arrow types for a table, so every page appends to one Parquet file."""
+    schema = TABLE_SCHEMAS.get(table, {})
+    kinds = {**{c: pa.date32() for c in schema.get("dates", [])},
+             **{c: pa.int64() for c in schema.get("ints", [])},
+             **{c: pa.float64() for c in schema.get("floats", [])}}
+    return pa.schema([(c, kinds.get(c, pa.string())) for c in columns])
+
+def _typed(df, schema):
+    """Cast one page of JSON values to `schema`."""
+    out = {}
+    for field in schema:
+        col = df[field.name] if field.name in df.columns else pd.Series(None, index=df.index)
+        if field.type == pa.date32():
+            col = pd.to_datetime(col, errors="coerce", format="ISO8601").dt.date
+        elif field.type == pa.int64():
+            col = pd.to_numeric(col, errors="coerce").round().astype("Int64")
+        elif field.type == pa.float64():
+            col = pd.to_numeric(col, errors="coerce").astype(float)
+        else:
+            col = col.astype("string")
+        out[field.name] = col
+    return pa.Table.from_pandas(pd.DataFrame(out), schema=schema, preserve_index=False)
+
+def _export_table(zf, table, fmt, filters, page_size, progress):
+    rows = 0
+    with perf.span("export_table", table=table, format=fmt) as rec:
+        compress = zipfile.ZIP_DEFLATED if fmt == "csv" else zipfile.ZIP_STORED
+        info = zipfile.ZipInfo(f"{table}.{fmt}", time.localtime()[:6])
+        info.compress_type = compress
+        with zf.open(info, "w", force_zip64=True) as f:
+            writer = None
+            for page in iter_table_pages(table, order=WATERMARK_COLS.get(table),
+                                         page_size=page_size, filters=filters):
+                if fmt == "csv":
+                    f.write(page.to_csv(index=False, header=rows == 0).encode("utf-8"))
+                else:
+                    if writer is None:
+                        schema = _arrow_schema(table, list(page.columns))
+                        writer = pq.ParquetWriter(f, schema)
+                    writer.write_table(_typed(page, schema))
+                rows += len(page)
+                if progress:
+                    progress(table, rows)
+            if writer is not None:
+                writer.close()
+        rec["rows"] = rows
+    return rows
+
+def export_tables(out, tables=None, fmt="csv", start=None, end=None, brands=None,
+                  page_size=PAGE_SIZE, progress=None):
+    """Write `tables` (default: all) to the zip file `out` (path or binary file object).
+
+    `start`/`end` filter on each table's date column (WATERMARK_COLS) and
+    `brands` on brand. `progress(table, rows_so_far)` is called after every
+    page. The bundle also holds manifest.json with the filters and row
+    counts. Returns {table: rows}.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}; use one of {EXPORT_FORMATS}")
+    tables = list(tables or EXPORT_TABLES)
+    counts = {}
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for table in tables:
+            filters = make_filters(WATERMARK_COLS.get(table), start, end, brands)
+            counts[table] = _export_table(zf, table, fmt, filters, page_size, progress)
+        manifest = {
+            "exported_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "format": fmt,
+            "filters": {"start": start and str(start), "end": end and str(end),
+                        "brands": list(brands) if brands is not None else None},
+            "rows": counts,
+        }
+        zf.writestr("manifest.json", json.dumps(manifest, indent=2))
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export metric tables to a zipped CSV/Parquet bundle.")
+    parser.add_argument("out", help="zip file to write")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--tables", default=",".join(EXPORT_TABLES),
+                        help="comma-separated tables (default: all)")
+    parser.add_argument("--start", help="first date to include (YYYY-MM-DD)")
+    parser.add_argument("--end", help="last date to include (YYYY-MM-DD)")
+    parser.add_argument("--brands", help="comma-separated brands (default: all)")
+    args = parser.parse_args(argv)
+
+    tables = [t.strip() for t in args.tables.split(",") if t.strip()]
+    brands = [b.strip() for b in args.brands.split(",")] if args.brands else None
+    t0 = time.perf_counter()
+
+    def progress(table, rows):
+        print(f"\r{table:<16} {rows:>12,} rows", end="", file=sys.stderr, flush=True)
+
+    counts = export_tables(args.out, tables, args.format, args.start, args.end, brands,
+                           progress=progress)
+    print(file=sys.stderr)
+    seconds = time.perf_counter() - t0
+    for table, rows in counts.items():
+        print(f"{table:<16} {rows:>12,} rows")
+    print(f"Wrote {sum(counts.values()):,} rows to {args.out} in {seconds:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Headless batch import of a directory of CSVs, without the Streamlit UI.
+
+Each file is matched to a table by name (`ads_metrics.csv`,
+`ads_metrics_2025-10-01.csv`, ...) and run through the same chunked
+coerce → dedup → upsert pipeline as large uploads on the Data Entry page,
+using the table definitions in IMPORT_SPECS. Tables are imported in
+parallel, the files of one table one after another.
+
+    python -m utils.ingest exports/ --mode keep --dry-run
+"""
+import argparse
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from utils import perf
+from utils.supabase_helpers import CSV_CHUNK_ROWS, IMPORT_SPECS, import_chunks, import_spec
+
+INGEST_MODES = ("keep", "overwrite", "diff")
+INGEST_WORKERS = 4
+
+def match_table(path):
+    """Table a CSV belongs to, from the longest IMPORT_SPECS name its file name starts with."""
+    stem = Path(path).stem.lower()
+    names = [t for t in IMPORT_SPECS if stem == t or stem.startswith(t + "_") or stem.startswith(t + "-")]
+    return max(names, key=len) if names else None
+
+def plan(directory):
+    """{table: [csv paths]} for the CSVs in `directory`, plus the unmatched paths."""
+    files, unmatched = {}, []
+    for path in sorted(Path(directory).glob("*.csv")):
+        table = match_table(path)
+        if table is None:
+            unmatched.append(path)
+        else:
+            files.setdefault(table, []).append(path)
+    return files, unmatched
+
+def ingest_file(path, table, mode="keep", dry_run=False, chunk_rows=CSV_CHUNK_ROWS):
+    """Import one CSV into `table`; returns import_chunks totals plus file and seconds."""
+    spec = import_spec(table)
+    t0 = time.perf_counter()
+    with perf.span("ingest_file", table=table, mode=mode, dry_run=dry_run) as rec:
+        missing = [c for c in spec["expected_cols"] if c not in pd.read_csv(path, nrows=0).columns]
+        if missing:
+            raise ValueError(f"{Path(path).name}: missing columns {missing}")
+        totals = import_chunks(
+            pd.read_csv(path, usecols=spec["expected_cols"], chunksize=chunk_rows),
+            mode=mode, dry_run=dry_run, **spec
+        )
+        rec["rows"] = totals["read"]
+    return {**totals, "file": str(path), "seconds": time.perf_counter() - t0}
+
+def ingest_table(table, paths, mode="keep", dry_run=False):
+    """Import `paths` into `table` in order; a file that fails is reported, the rest go on."""
+    results = []
+    for path in paths:
+        try:
+            results.append({"table": table, **ingest_file(path, table, mode, dry_run)})
+        except Exception as e:
+            results.append({"table": table, "file": str(path), "error": f"{type(e).__name__}: {e}"})
+    return results
+
+def ingest_directory(directory, mode="keep", dry_run=False, tables=None, max_workers=INGEST_WORKERS):
+    """Import every matching CSV in `directory`, tables in parallel.
+
+    Returns (one result per file, unmatched paths).
+    """
+    if mode not in INGEST_MODES:
+        raise ValueError(f"Unknown mode {mode!r}; use one of {INGEST_MODES}")
+    files, unmatched = plan(directory)
+    if tables is not None:
+        files = {t: p for t, p in files.items() if t in tables}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = [perf.submit(pool, ingest_table, t, p, mode, dry_run) for t, p in files.items()]
+        results = [r for f in futures for r in f.result()]
+    return results, unmatched
+
+def summary(results, seconds):
+    """Per-table throughput lines and a total, as printed by the CLI."""
+    cols = ["read", "rows", "written", "skipped", "failed"]
+    ok = [r for r in results if "error" not in r]
+    lines = [f"{'table':<16}{'files':>6}{'read':>12}{'to write':>12}{'written':>12}"
+             f"{'skipped':>12}{'failed':>9}{'rows/s':>12}"]
+    by_table = {}
+    for r in ok:
+        t = by_table.setdefault(r["table"], {"files": 0, "seconds": 0.0, **dict.fromkeys(cols, 0)})
+        t["files"] += 1
+        t["seconds"] += r["seconds"]
+        for c in cols:
+            t[c] += r[c]
+    for table, t in sorted(by_table.items()):
+        rate = t["read"] / t["seconds"] if t["seconds"] else 0
+        lines.append(f"{table:<16}{t['files']:>6}{t['read']:>12,}{t['rows']:>12,}{t['written']:>12,}"
+                     f"{t['skipped']:>12,}{t['failed']:>9,}{rate:>12,.0f}")
+    read = sum(t["read"] for t in by_table.values())
+    written = sum(t["written"] for t in by_table.values())
+    lines.append(f"Total: {read:,} rows read, {written:,} written from {len(ok)} files "
+                 f"in {seconds:.1f}s ({read / seconds if seconds else 0:,.0f} rows/s)")
+    lines += [f"FAILED {Path(r['file']).name}: {r['error']}" for r in results if "error" in r]
+    lines += [f"FAILED {Path(r['file']).name}: {r['failed']:,} rows; first error: {r['batches'][0]['error']}"
+              for r in ok if r["failed"] and r["batches"]]
+    return lines
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import a directory of metric CSVs into Supabase.")
+    parser.add_argument("directory", help="folder of CSVs named after their table")
+    parser.add_argument("--mode", choices=INGEST_MODES, default="keep",
+                        help="existing rows: keep (skip), overwrite, or diff (write only changed)")
+    parser.add_argument("--dry-run", action="store_true", help="classify rows, write nothing")
+    parser.add_argument("--tables", help="comma-separated tables to import (default: all found)")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="tables imported at once")
+    args = parser.parse_args(argv)
+    # Outside `streamlit run` every st.* call warns about a missing ScriptRunContext
+    for name in list(logging.root.manager.loggerDict):
+        if name.startswith("streamlit"):
+            logging.getLogger(name).setLevel(logging.ERROR)
+
+    tables = [t.strip() for t in args.tables.split(",")] if args.tables else None
+    t0 = time.perf_counter()
+    results, unmatched = ingest_directory(args.directory, args.mode, args.dry_run, tables, args.workers)
+    for path in unmatched:
+        print(f"Skipped {path.name}: no table matches its name", file=sys.stderr)
+    if args.dry_run:
+        print("Dry run — nothing was written.")
+    print("\n".join(summary(results, time.perf_counter() - t0)))
+    failed = any("error" in r or r["failed"] for r in results)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""Instrumentation for Supabase calls and page transforms.
+
+Every `span()` records latency, rows, bytes and cache outcome. Records go to
+a structured log line (logger "ftt.perf"), to Prometheus-style counters and
+histograms flushed to METRICS_FILE, and to the current page run so the
+sidebar panel can list them.
+"""
+import contextvars
+import httpx
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+log = logging.getLogger("ftt.perf")
+
+METRICS_FILE = Path(os.environ.get("FTT_METRICS_FILE", ".cache/metrics.prom"))
+METRICS_FLUSH_INTERVAL = 10    # seconds between metric file writes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_counters = {}                 # (name, labels) -> value
+_histograms = {}               # (name, labels) -> [bucket counts..., sum, count]
+_last_flush = 0.0
+_run_events = contextvars.ContextVar("ftt_perf_run", default=None)
+_current_span = contextvars.ContextVar("ftt_perf_span", default=None)
+
+def _labels(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def inc(name, value=1, **labels):
+    with _lock:
+        key = (name, _labels(labels))
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(name, value, **labels):
+    with _lock:
+        key = (name, _labels(labels))
+        h = _histograms.setdefault(key, [0] * len(LATENCY_BUCKETS) + [0.0, 0])
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                h[i] += 1
+        h[-2] += value
+        h[-1] += 1
+
+# ---- SPANS ----
+@contextmanager
+def span(op, **fields):
+    """Time the enclosed block as one `op` call.
+
+    The yielded dict accepts extra fields (rows, cache, mode, ...); response
+    and request bytes of HTTP calls made inside are added automatically.
+    """
+    rec = {"op": op, **fields, "rows": None, "bytes": 0, "sent": 0}
+    parent = _current_span.get()
+    token = _current_span.set(rec)
+    t0 = time.perf_counter()
+    try:
+        yield rec
+    except Exception as e:
+        rec["error"] = type(e).__name__
+        raise
+    finally:
+        rec["seconds"] = time.perf_counter() - t0
+        _current_span.reset(token)
+        if parent is not None:
+            parent["bytes"] += rec["bytes"]
+            parent["sent"] += rec["sent"]
+        _record(rec)
+
+def record(op, seconds, **fields):
+    """Record an already-timed call (for code paths not wrapped in span())."""
+    _record({"op": op, "rows": None, "bytes": 0, "sent": 0, **fields, "seconds": seconds})
+
+def annotate(**fields):
+    """Set fields on the innermost open span, if any."""
+    rec = _current_span.get()
+    if rec is not None:
+        rec.update(fields)
+
+def _record(rec):
+    table = rec.get("table", "")
+    observe("ftt_call_seconds", rec["seconds"], op=rec["op"], table=table)
+    inc("ftt_calls_total", op=rec["op"], table=table)
+    if rec.get("error"):
+        inc("ftt_call_errors_total", op=rec["op"], table=table)
+    if rec["rows"]:
+        inc("ftt_rows_total", rec["rows"], op=rec["op"], table=table)
+    if rec.get("cache"):
+        inc("ftt_cache_total", op=rec["op"], table=table, result=rec["cache"])
+    log.info(json.dumps(rec, default=str))
+    events = _run_events.get()
+    if events is not None:
+        events.append(rec)
+    _maybe_flush()
+
+# ---- HTTP HOOKS ----
+def _on_request(request):
+    n = len(request.content or b"")
+    inc("ftt_request_bytes_total", n)
+    rec = _current_span.get()
+    if rec is not None:
+        rec["sent"] += n
+
+def _on_response(response):
+    response.read()
+    n = len(response.content)
+    inc("ftt_response_bytes_total", n)
+    rec = _current_span.get()
+    if rec is not None:
+        rec["bytes"] += n
+
+async def _aon_request(request):
+    _on_request(request)
+
+async def _aon_response(response):
+    await response.aread()
+    _on_response(response)
+
+def instrument_client(client):
+    """Count request/response bytes of a supabase client's PostgREST session (sync or async)."""
+    session = client.postgrest.session
+    hooks = session.event_hooks
+    if isinstance(session, httpx.AsyncClient):
+        hooks["request"].append(_aon_request)
+        hooks["response"].append(_aon_response)
+    else:
+        hooks["request"].append(_on_request)
+        hooks["response"].append(_on_response)
+    session.event_hooks = hooks
+    return client
+
+# ---- RUN CONTEXT ----
+def submit(pool, fn, *args, **kwargs):
+    """pool.submit that carries the caller's run and span into the worker thread."""
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+def begin_run():
+    """Start collecting span records for the current page run."""
+    _run_events.set([])
+
+def run_events():
+    return list(_run_events.get() or [])
+
+# ---- EXPORT ----
+def prometheus_text():
+    """Current counters and histograms in Prometheus text exposition format."""
+    def fmt(labels):
+        return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}" if labels else ""
+
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted(_histograms.items())
+    for name in sorted({n for (n, _), _ in counters}):
+        lines.append(f"# TYPE {name} counter")
+        lines += [f"{n}{fmt(l)} {v}" for (n, l), v in counters if n == name]
+    for name in sorted({n for (n, _), _ in histograms}):
+        lines.append(f"# TYPE {name} histogram")
+        for (n, l), h in histograms:
+            if n != name:
+                continue
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                lines.append(f"{n}_bucket{fmt(l + (('le', str(bound)),))} {h[i]}")
+            lines.append(f"{n}_bucket{fmt(l + (('le', '+Inf'),))} {h[-1]}")
+            lines.append(f"{n}_sum{fmt(l)} {h[-2]}")
+            lines.append(f"{n}_count{fmt(l)} {h[-1]}")
+    return "\n".join(lines) + "\n"
+
+def write_metrics(path=None):
+    """Write prometheus_text() atomically to `path` (default METRICS_FILE)."""
+    path = Path(path or METRICS_FILE)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(prometheus_text())
+        os.replace(tmp, path)
+    except OSError:
+        pass  # metrics are best-effort
+
+def _maybe_flush():
+    global _last_flush
+    now = time.monotonic()
+    with _lock:
+        if now - _last_flush < METRICS_FLUSH_INTERVAL:
+            return
+        _last_flush = now
+    write_metrics()
@@ -1,16 +1,104 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import httpx
+import asyncio
+import contextvars
+import json
+import os
 import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import date, datetime
-from supabase import create_client
+from functools import partial
+from pathlib import Path
+from supabase import acreate_client, create_client
 from postgrest.exceptions import APIError
+from utils import perf
 
 # ---- SUPABASE CONNECTION ----
+# One connection pool per process, shared by every session through
+# st.cache_resource. Each key can be overridden under [http] in secrets.toml.
+HTTP_DEFAULTS = {
+    "http2": True,
+    "max_connections": 20,
+    "max_keepalive_connections": 10,
+    "keepalive_expiry": 120.0,     # seconds an idle connection is kept open
+    "timeout": 30.0,
+    "connect_timeout": 5.0,
+}
+
+def _http_settings():
+    return {**HTTP_DEFAULTS, **st.secrets.get("http", {})}
+
+def _pooled_session(session):
+    """Copy of a PostgREST httpx session (sync or async) using the shared pool settings."""
+    s = _http_settings()
+    cls = httpx.AsyncClient if isinstance(session, httpx.AsyncClient) else httpx.Client
+    return cls(
+        base_url=session.base_url,
+        headers=session.headers,
+        http2=bool(s["http2"]),
+        limits=httpx.Limits(max_connections=int(s["max_connections"]),
+                            max_keepalive_connections=int(s["max_keepalive_connections"]),
+                            keepalive_expiry=float(s["keepalive_expiry"])),
+        timeout=httpx.Timeout(float(s["timeout"]), connect=float(s["connect_timeout"])),
+        follow_redirects=True,
+    )
+
 @st.cache_resource
 def get_supabase():
     url = st.secrets["supabase"]["url"]
     key = st.secrets["supabase"]["key"]
-    return create_client(url, key)
+    client = create_client(url, key)
+    default = client.postgrest.session
+    client.postgrest.session = _pooled_session(default)
+    default.close()
+    return perf.instrument_client(client)
+
+# ---- ASYNC CLIENT ----
+# The AsyncClient is bound to one event loop, run on a daemon thread shared by
+# all sessions; script threads hand it coroutines through run_async().
+@st.cache_resource
+def _client_loop():
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="supabase-async", daemon=True).start()
+    return loop
+
+async def _in_context(ctx, coro):
+    # Carry the caller's context (perf run and span) into the loop thread
+    for var, value in ctx.items():
+        var.set(value)
+    return await coro
+
+def run_async(coro, timeout=None):
+    """Run `coro` on the shared client loop and wait for its result."""
+    ctx = contextvars.copy_context()
+    return asyncio.run_coroutine_threadsafe(_in_context(ctx, coro), _client_loop()).result(timeout)
+
+@st.cache_resource
+def get_async_supabase():
+    url = st.secrets["supabase"]["url"]
+    key = st.secrets["supabase"]["key"]
+
+    async def _create():
+        client = await acreate_client(url, key)
+        default = client.postgrest.session
+        client.postgrest.session = _pooled_session(default)
+        await default.aclose()
+        return perf.instrument_client(client)
+
+    return run_async(_create())
+
+async def _aexecute(query, table):
+    """Await one async PostgREST query as a timed `select` call."""
+    with perf.span("select", table=table) as rec:
+        res = await query.execute()
+        rec["rows"] = len(res.data)
+    return res
 
 # ---- AUTHENTICATION ----
 def _do_login(username, password):
@@ -59,10 +147,25 @@ def login_page():
         st.rerun()
 
 def ensure_login():
+    perf.begin_run()
     if not st.session_state.get("logged_in"):
         login_page()
         st.stop()
 
+def show_perf_panel():
+    """Sidebar toggle listing the timed calls of this page run."""
+    if not st.sidebar.toggle("⏱️ Performance", key="_perf_panel"):
+        return
+    events = perf.run_events()
+    if not events:
+        st.sidebar.caption("No timed calls in this run.")
+        return
+    cols = ["op", "table", "seconds", "rows", "bytes", "cache", "mode", "error"]
+    df = pd.DataFrame(events).reindex(columns=cols)
+    df["seconds"] = df["seconds"].round(3)
+    st.sidebar.caption(f"{len(df)} calls · {df['seconds'].sum():.2f}s total")
+    st.sidebar.dataframe(df.dropna(axis=1, how="all"), hide_index=True, use_container_width=True)
+
 # ---- SUPABASE BASIC OPERATIONS ----
 def _to_jsonable(row: dict) -> dict:
     """Convert Python/pandas values to JSON-safe ones for Supabase."""
@@ -81,63 +184,1426 @@ def _to_jsonable(row: dict) -> dict:
         out[k] = v
     return out
 
-def fetch_table(table, order=None, limit=1000):
+def _is_date_column(col):
+    """True for datetime64 columns and object columns holding date/datetime values."""
+    if pd.api.types.is_datetime64_any_dtype(col):
+        return True
+    if col.dtype != object:
+        return False
+    first = col.first_valid_index()
+    return first is not None and isinstance(col[first], (date, datetime))
+
+def _iso_dates(col):
+    """Format a date-like column as YYYY-MM-DD strings (None for missing).
+
+    Only the distinct values go through strftime — metric tables repeat each
+    date once per brand, so this is far cheaper than formatting every cell.
+    """
+    codes, uniques = pd.factorize(pd.to_datetime(col, errors="coerce"))
+    labels = np.asarray(uniques.strftime("%Y-%m-%d"), dtype=object)
+    out = labels[codes] if len(labels) else np.full(len(codes), None, dtype=object)
+    out[codes < 0] = None
+    return out.tolist()
+
+def frame_to_records(df, date_cols=(), int_cols=(), float_cols=()):
+    """Columnar counterpart of _to_jsonable: DataFrame → JSON-safe records.
+
+    Each column is converted once — dates to ISO strings, `int_cols` /
+    `float_cols` cast, NaN/NaT to None. Date columns not listed in
+    `date_cols` are detected from their values.
+    """
+    cols = list(df.columns)
+    values = []
+    for c in cols:
+        col = df[c]
+        if c in date_cols or _is_date_column(col):
+            values.append(_iso_dates(col))
+            continue
+        if c in int_cols:
+            col = pd.to_numeric(col, errors="coerce").round().astype("Int64")
+        elif c in float_cols:
+            col = pd.to_numeric(col, errors="coerce").astype(float)
+        values.append(col.astype(object).where(col.notna(), None).tolist())
+    return [dict(zip(cols, row)) for row in zip(*values)]
+
+# Conflict key of each metric table — also the stable sort order used for paging
+TABLE_KEYS = {
+    "ga_traffic":     ["brand", "start_date", "end_date"],
+    "ads_metrics":    ["brand", "date"],
+    "agent_postings": ["brand", "date"],
+    "google_index":   ["brand", "date"],
+    "semrush_rank":   ["brand", "date"],
+    "bounce_rate":    ["brand", "week_start"],
+}
+
+# Column dtypes set once when rows arrive, so pages get parsed dates,
+# a categorical brand and downcast integer metrics instead of strings and
+# int64. Floats stay float64 so stored values compare and format exactly
+TABLE_SCHEMAS = {
+    "ga_traffic":     {"dates": ["start_date", "end_date"], "ints": ["users"]},
+    "ads_metrics":    {"dates": ["date"], "ints": ["clicks", "impressions"]},
+    "agent_postings": {"dates": ["date"], "ints": ["total_listings", "sale_listings",
+                                                   "rent_listings", "auction_listings"]},
+    "google_index":   {"dates": ["date"], "ints": ["indexed"]},
+    "semrush_rank":   {"dates": ["date"], "ints": ["rank"]},
+    "bounce_rate":    {"dates": ["week_start", "week_end"], "floats": ["bounce_rate"]},
+}
+
+def apply_schema(df, table):
+    """Cast `df` to the TABLE_SCHEMAS dtypes of `table`; other tables pass through."""
+    schema = TABLE_SCHEMAS.get(table)
+    if schema is None or df.empty:
+        return df
+    df = df.copy(deep=False)
+    if "brand" in df.columns:
+        df["brand"] = df["brand"].astype("category")
+    for c in schema.get("dates", []):
+        if c in df.columns:
+            df[c] = pd.to_datetime(df[c], errors="coerce", format="ISO8601")
+    for c in schema.get("ints", []):
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c], errors="coerce", downcast="integer")
+    for c in schema.get("floats", []):
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")
+    return df
+
+# PostgREST caps a single response at 1000 rows by default
+PAGE_SIZE = 1000
+MAX_WORKERS = 4
+
+def make_filters(date_col=None, start=None, end=None, brands=None):
+    """Build a filter spec for fetch_table: date range on `date_col` and/or brand list."""
+    return {"date_col": date_col, "start": start, "end": end, "brands": brands}
+
+def _apply_filters(q, filters):
+    """Translate a filter spec into PostgREST gte/lte/in_ filters."""
+    if not filters:
+        return q
+    date_col = filters.get("date_col")
+    if date_col and filters.get("start") is not None:
+        q = q.gte(date_col, str(filters["start"]))
+    if date_col and filters.get("end") is not None:
+        q = q.lte(date_col, str(filters["end"]))
+    if filters.get("brands") is not None:
+        q = q.in_("brand", list(filters["brands"]))
+    return q
+
+def iter_table_pages(table, order=None, limit=None, page_size=PAGE_SIZE,
+                     max_workers=MAX_WORKERS, filters=None, columns=None):
+    """Yield `table` as DataFrame pages, fetching up to `max_workers` pages at once.
+
+    Pages are ordered by `order` (if given) then the table key, so range
+    offsets stay stable across requests. `filters` is a make_filters() spec
+    evaluated by the database; `columns` limits the columns returned.
+    """
     sb = get_supabase()
-    q = sb.table(table).select("*").limit(limit)
-    if order:
-        q = q.order(order)
-    res = q.execute()
-    return pd.DataFrame(res.data)
-
-def upsert_rows(table, rows, conflict_cols):
-    """Perform UPSERT (insert or update) with better error handling."""
+    order_cols = ([order] if order else []) + [c for c in TABLE_KEYS.get(table, []) if c != order]
+
+    def _fetch(start):
+        with perf.span("select_page", table=table) as rec:
+            q = _apply_filters(sb.table(table).select(",".join(columns) if columns else "*"), filters)
+            for c in order_cols:
+                q = q.order(c)
+            data = q.range(start, start + page_size - 1).execute().data
+            rec["rows"] = len(data)
+        return data
+
+    # First page alone (most filtered reads fit in one), then `max_workers` at a time
+    offset, window = 0, 1
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while limit is None or offset < limit:
+            starts = [offset + i * page_size for i in range(window)]
+            if limit is not None:
+                starts = [s for s in starts if s < limit]
+            futures = [perf.submit(pool, _fetch, s) for s in starts]
+            for start, data in zip(starts, (f.result() for f in futures)):
+                if limit is not None:
+                    data = data[:limit - start]
+                if data:
+                    yield pd.DataFrame(data)
+                if len(data) < page_size:
+                    return
+            offset, window = starts[-1] + page_size, max_workers
+
+# ---- READ CACHE ----
+# Process-wide, shared by all sessions. Entries are keyed by (table, query) so
+# a write to one table only drops that table's entries.
+CACHE_TTL = 300          # seconds
+CACHE_MAX_ENTRIES = 128
+_read_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _freeze(value):
+    """Make filter specs / query args hashable for use in a cache key."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+def _cache_get(key, ttl):
+    """Copy of the cached DataFrame for `key` if younger than `ttl`, else None."""
+    with _cache_lock:
+        hit = _read_cache.get(key)
+        if hit and time.monotonic() - hit[0] < ttl:
+            _read_cache.move_to_end(key)
+            return hit[1].copy()
+    return None
+
+def _cache_put(key, df, loaded_at):
+    with _cache_lock:
+        _read_cache[key] = (loaded_at, df.copy())
+        _read_cache.move_to_end(key)
+        while len(_read_cache) > CACHE_MAX_ENTRIES:
+            _read_cache.popitem(last=False)
+
+def cached_read(table, query, loader, ttl=CACHE_TTL):
+    """Return `loader()` for (table, query), reusing a cached DataFrame younger than `ttl`."""
+    if not ttl:
+        return loader()
+    key = (table, _freeze(query))
+    hit = _cache_get(key, ttl)
+    if hit is not None:
+        perf.annotate(cache="hit")
+        return hit
+    perf.annotate(cache="miss")
+    now = time.monotonic()
+    df = loader()
+    _cache_put(key, df, now)
+    return df
+
+def invalidate_table(table):
+    """Drop every cached read of `table` (called after writes)."""
+    with _cache_lock:
+        for key in [k for k in _read_cache if k[0] == table]:
+            del _read_cache[key]
+
+def clear_read_cache():
+    with _cache_lock:
+        _read_cache.clear()
+
+def fetch_table(table, order=None, limit=None, page_size=PAGE_SIZE,
+                max_workers=MAX_WORKERS, filters=None, ttl=CACHE_TTL, columns=None):
+    """Fetch a whole table (or its first `limit` rows) as one DataFrame.
+
+    Results are cached for `ttl` seconds; pass ttl=0 to force a fresh read.
+    """
+    def _load():
+        pages = list(iter_table_pages(table, order, limit, page_size, max_workers, filters, columns))
+        if not pages:
+            return pd.DataFrame()
+        return apply_schema(pd.concat(pages, ignore_index=True), table)
+
+    with perf.span("fetch_table", table=table) as rec:
+        df = cached_read(table, ("fetch_table", order, limit, filters, columns), _load, ttl)
+        rec["rows"] = len(df)
+    return df
+
+def fetch_page(table, page, page_size=100, order=None, desc=True, ttl=CACHE_TTL):
+    """One page (0-based) of `table` sorted in the database, plus the total row count.
+
+    Rows are ordered by `order` (descending by default) then the table key,
+    so pages do not overlap. Returns (DataFrame, total).
+    """
+    def _load():
+        order_cols = ([order] if order else []) + [c for c in TABLE_KEYS.get(table, []) if c != order]
+        q = get_supabase().table(table).select("*", count="exact")
+        for c in order_cols:
+            q = q.order(c, desc=desc)
+        start = page * page_size
+        res = q.range(start, start + page_size - 1).execute()
+        df = apply_schema(pd.DataFrame(res.data), table)
+        df.attrs["total"] = res.count or 0
+        return df
+
+    with perf.span("fetch_page", table=table) as rec:
+        df = cached_read(table, ("page", page, page_size, order, desc), _load, ttl)
+        rec["rows"] = len(df)
+    return df, df.attrs.get("total", 0)
+
+async def _alatest(sb, table, brands, n, order_by):
+    """Latest `n` rows per brand: one query for all brands, then concurrent
+    follow-ups only for brands left short (sparser recent history)."""
+    size = min(max(n * len(brands), 1), PAGE_SIZE)
+    data = (await _aexecute(sb.table(table).select("*").in_("brand", brands)
+                            .order(order_by, desc=True).order("brand").limit(size), table)).data
+    df = pd.DataFrame(data)
+    if len(data) == size:
+        counts = df["brand"].value_counts()
+        extra = await asyncio.gather(*[
+            _aexecute(sb.table(table).select("*").eq("brand", b)
+                      .order(order_by, desc=True).limit(n), table)
+            for b in brands if counts.get(b, 0) < n
+        ])
+        rows = [r for res in extra for r in res.data]
+        if rows:
+            df = pd.concat([df[~df["brand"].isin({r["brand"] for r in rows})],
+                            pd.DataFrame(rows)], ignore_index=True)
+    if df.empty:
+        return df
+    df = apply_schema(df, table).sort_values(order_by, ascending=False, kind="stable")
+    return df.groupby("brand", sort=False, observed=True).head(n).reset_index(drop=True)
+
+def fetch_latest_many(specs, ttl=CACHE_TTL):
+    """Latest rows per brand for several tables, fetched concurrently.
+
+    `specs` maps a result name to (table, brands, n, order_by). Cache misses
+    are all in flight at once on the shared async client. Returns (frames,
+    errors) like fetch_tables.
+    """
+    frames, errors, misses = {}, {}, {}
+    for name, (table, brands, n, order_by) in specs.items():
+        key = (table, _freeze(("latest", tuple(brands), n, order_by)))
+        hit = _cache_get(key, ttl) if ttl else None
+        if hit is None:
+            misses[name] = key
+            continue
+        with perf.span("fetch_latest", table=table, cache="hit") as rec:
+            rec["rows"] = len(hit)
+        frames[name] = hit
+    if not misses:
+        return frames, errors
+
+    async def _load(name):
+        table, brands, n, order_by = specs[name]
+        with perf.span("fetch_latest", table=table, cache="miss") as rec:
+            df = await _alatest(sb, table, list(brands), n, order_by)
+            rec["rows"] = len(df)
+        return df
+
+    async def _load_all():
+        return await asyncio.gather(*[_load(name) for name in misses], return_exceptions=True)
+
+    sb = get_async_supabase()
+    now = time.monotonic()
+    for (name, key), result in zip(misses.items(), run_async(_load_all())):
+        if isinstance(result, Exception):
+            errors[name] = result
+            frames[name] = pd.DataFrame()
+            continue
+        if ttl:
+            _cache_put(key, result, now)
+        frames[name] = result
+    return frames, errors
+
+def fetch_latest_per_brand(table, brands, n, order_by="date", ttl=CACHE_TTL):
+    """Latest `n` rows per brand of `table`, newest first."""
+    frames, errors = fetch_latest_many({table: (table, brands, n, order_by)}, ttl)
+    if table in errors:
+        raise errors[table]
+    return frames[table]
+
+def fetch_tables(queries, max_workers=6, loader=None):
+    """Run several fetch_table queries at once on a bounded thread pool.
+
+    `queries` maps a result name to a table name or a (table, kwargs) tuple;
+    `loader` (default fetch_table) is called as loader(table, **kwargs).
+    Returns (frames, errors): a DataFrame per name (empty on failure) and
+    the exception raised for each failed name.
+    """
+    loader = loader or fetch_table
+    get_supabase()  # resolve the shared client before fanning out
+    specs = {
+        name: (q, {}) if isinstance(q, str) else q
+        for name, q in queries.items()
+    }
+    frames, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            name: perf.submit(pool, loader, table, **kwargs)
+            for name, (table, kwargs) in specs.items()
+        }
+        for name, fut in futures.items():
+            try:
+                frames[name] = fut.result()
+            except Exception as e:
+                frames[name] = pd.DataFrame()
+                errors[name] = e
+    return frames, errors
+
+# ---- BACKGROUND REFRESH ----
+# Stale-while-revalidate: registered loaders are re-run on a scheduler thread
+# every `interval` seconds and reads return the last good result without
+# waiting. Jobs nobody has read for REFRESH_IDLE_TIMEOUT are dropped.
+REFRESH_INTERVAL = int(os.environ.get("FTT_REFRESH_INTERVAL", 300))   # seconds
+REFRESH_IDLE_TIMEOUT = 3600
+REFRESH_WORKERS = 4
+REFRESH_TICK = 1.0
+_jobs = {}                       # name -> {"load", "interval", "value", "as_of", "due", ...}
+_jobs_lock = threading.Lock()
+_scheduler = None
+
+def register_refresh(name, load, interval=REFRESH_INTERVAL, run_now=False):
+    """Have the scheduler call `load()` every `interval` seconds; returns the job.
+
+    The first background run is one interval away unless `run_now`.
+    Registering again only marks the job as read (keeps it alive).
+    """
+    global _scheduler
+    now = time.monotonic()
+    with _jobs_lock:
+        job = _jobs.get(name)
+        if job is None:
+            job = _jobs[name] = {"load": load, "interval": interval, "value": None, "as_of": None,
+                                 "error": None, "running": False, "due": now + interval}
+        job["read_at"] = now
+        if run_now:
+            job["due"] = min(job["due"], now)
+        if _scheduler is None or not _scheduler.is_alive():
+            _scheduler = threading.Thread(target=_schedule_loop, name="refresh-scheduler", daemon=True)
+            _scheduler.start()
+    return job
+
+def read_refreshed(name, load, interval=REFRESH_INTERVAL, force=False):
+    """(last good `load()` result, datetime it was loaded) for job `name`.
+
+    Only the first read, or `force`, runs `load` in the foreground; a
+    failed background run keeps serving the previous result.
+    """
+    job = register_refresh(name, load, interval)
+    if force or job["as_of"] is None:
+        _run_job(job)
+        if job["as_of"] is None:
+            raise job["error"]
+    return job["value"], job["as_of"]
+
+def refreshes_running():
+    """Number of jobs running or due right now."""
+    now = time.monotonic()
+    with _jobs_lock:
+        return sum(j["running"] or j["due"] <= now for j in _jobs.values())
+
+def _run_job(job):
+    with _jobs_lock:
+        job["running"] = True
+    try:
+        value = job["load"]()
+    except Exception as e:
+        with _jobs_lock:
+            job.update(error=e, running=False, due=time.monotonic() + job["interval"])
+        return
+    with _jobs_lock:
+        job.update(value=value, as_of=datetime.now(), error=None, running=False,
+                   due=time.monotonic() + job["interval"])
+
+def _schedule_loop():
+    pool = ThreadPoolExecutor(REFRESH_WORKERS, thread_name_prefix="refresh")
+    while True:
+        now = time.monotonic()
+        with _jobs_lock:
+            for name in [n for n, j in _jobs.items()
+                         if not j["running"] and now - j["read_at"] > REFRESH_IDLE_TIMEOUT]:
+                del _jobs[name]
+            due = [j for j in _jobs.values() if not j["running"] and j["due"] <= now]
+            for job in due:
+                job["running"] = True
+        for job in due:
+            pool.submit(_run_job, job)
+        time.sleep(REFRESH_TICK)
+
+# ---- DELTA SYNC ----
+# Per-table local replica kept current by fetching only rows at or after a
+# watermark (the max of WATERMARK_COLS) and merging them in on TABLE_KEYS.
+WATERMARK_COLS = {
+    "ga_traffic":     "end_date",
+    "ads_metrics":    "date",
+    "agent_postings": "date",
+    "google_index":   "date",
+    "semrush_rank":   "date",
+    "bounce_rate":    "week_start",
+}
+SYNC_MIN_INTERVAL = 60           # seconds between delta requests for one table
+SYNC_FULL_INTERVAL = 6 * 3600    # periodic full re-read picks up edits made elsewhere
+_synced = {}                     # table -> {"frame", "watermark", "synced_at", "full_at"}
+_pending_writes = {}             # table -> lowest watermark value written (None = unknown)
+_sync_lock = threading.RLock()
+_NO_WRITES = object()
+
+def _note_write(table, records):
+    """Record a local write so the next sync re-reads from the oldest row written."""
+    col = WATERMARK_COLS.get(table)
+    values = [str(r[col]) for r in records if col and r.get(col) is not None]
+    low = min(values) if values and len(values) == len(records) else None
+    with _sync_lock:
+        prev = _pending_writes.get(table, _NO_WRITES)
+        if prev is not _NO_WRITES and (prev is None or low is None):
+            low = None
+        elif prev is not _NO_WRITES:
+            low = min(prev, low)
+        _pending_writes[table] = low
+
+def _merge_delta(frame, delta, table):
+    """Append `delta` to `frame`, keeping the newest copy of each keyed row."""
+    if frame.empty:
+        return delta
+    if delta.empty:
+        return frame
+    merged = pd.concat([frame, delta], ignore_index=True)
+    keys = TABLE_KEYS.get(table)
+    if keys:
+        merged = merged.drop_duplicates(keys, keep="last", ignore_index=True)
+    return apply_schema(merged, table)  # concat drops the categorical when brands differ
+
+def _watermark(df, col):
+    if df.empty or col not in df.columns:
+        return None
+    values = df[col].dropna()
+    if not len(values):
+        return None
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.max().strftime("%Y-%m-%d")
+    return values.astype(str).max()
+
+def _key_index(df, table):
+    return pd.MultiIndex.from_frame(df[TABLE_KEYS[table]].astype(str))
+
+def _commit(table, frame=None, delta=None, if_absent=False, rollup=None, **meta):
+    """Install new replica contents and keep the table's KPI rollup in step.
+
+    `frame` replaces the replica, with `rollup` as its rollup (e.g. from a
+    snapshot) or none until get_rollup builds one; `delta` rows are merged into the current replica
+    (rollup adjusted from the rows they replace). `meta` updates the state
+    (watermark, synced_at, ...); with `if_absent` an existing replica is
+    kept. The new replica and rollup are built outside the sync lock, which
+    is only held to swap them in, so readers are never blocked. A delta
+    whose base replica changed in the meantime is merged again onto the
+    new one.
+    """
+    while True:
+        with _sync_lock:
+            base = _synced.get(table)
+            base_rollup = _rollups.get(table)
+        if if_absent and base is not None:
+            return base
+        state = dict(base or {"frame": pd.DataFrame()})
+        new_rollup, old = base_rollup, None
+        if frame is not None:
+            state["frame"], new_rollup = frame, rollup
+        elif not delta.empty:
+            current = state["frame"]
+            old = current[_key_index(current, table).isin(_key_index(delta, table))] \
+                if not current.empty and table in TABLE_KEYS else current.iloc[:0]
+            state["frame"] = _merge_delta(current, delta, table)
+        try:
+            if old is not None and base_rollup is not None:
+                new_rollup = {k: dict(v) for k, v in base_rollup.items()}
+                _rollup_apply(new_rollup, table, old, delta)
+        except Exception:
+            new_rollup = None  # rebuilt from the replica on next read
+        state.update(meta)
+        with _sync_lock:
+            current = _synced.get(table)
+            if if_absent and current is not None:
+                return current
+            if frame is None and current is not base:
+                continue
+            _synced[table] = state
+            if new_rollup is None:
+                _rollups.pop(table, None)
+            else:
+                _rollups[table] = new_rollup
+            return state
+
+# ---- SNAPSHOTS ----
+# Each replica is also written to SNAPSHOT_DIR as Parquet plus a JSON stamp that
+# carries its KPI rollup, so a cold start memory-maps the last snapshot, skips
+# the rollup build and refreshes both in the background.
+SNAPSHOT_DIR = Path(os.environ.get("FTT_SNAPSHOT_DIR", ".cache/snapshots"))
+SNAPSHOT_FORMAT = 3     # 2: typed columns (TABLE_SCHEMAS), 3: floats kept as float64
+
+def _snapshot_paths(table):
+    return SNAPSHOT_DIR / f"{table}.parquet", SNAPSHOT_DIR / f"{table}.json"
+
+def _save_snapshot(table, state):
+    """Write `state` and its rollup atomically (tmp file + rename); failures only cost the snapshot."""
+    data_path, meta_path = _snapshot_paths(table)
+    with _sync_lock:
+        version = state.get("version", 0) + 1
+        state["version"] = version
+        rollup = _rollups.get(table) if _synced.get(table) is state else None
+    meta = {
+        "format": SNAPSHOT_FORMAT,
+        "version": version,
+        "watermark": state["watermark"],
+        "rows": len(state["frame"]),
+        "saved_at": time.time(),
+        "full_at": time.time() - (time.monotonic() - state["full_at"]),
+        "rollup": [[*k, v] for k, v in rollup.items()] if rollup is not None else None,
+    }
+    try:
+        SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = data_path.with_suffix(".parquet.tmp")
+        pq.write_table(pa.Table.from_pandas(state["frame"], preserve_index=False), tmp)
+        os.replace(tmp, data_path)
+        tmp = meta_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(meta, default=lambda v: v.item()))
+        os.replace(tmp, meta_path)
+    except (OSError, pa.ArrowException):
+        pass  # read-only or full disk: keep serving from memory
+
+def load_snapshot(table):
+    """Replica state from the on-disk snapshot of `table`, or None if absent/stale format."""
+    data_path, meta_path = _snapshot_paths(table)
+    try:
+        meta = json.loads(meta_path.read_text())
+        if meta.get("format") != SNAPSHOT_FORMAT:
+            return None
+        frame = pq.read_table(data_path, memory_map=True).to_pandas()
+    except (OSError, ValueError, pa.ArrowException):
+        return None
+    now = time.monotonic()
+    rollup = meta.get("rollup")
+    return {
+        "frame": frame,
+        "rollup": {tuple(r[:3]): r[3] for r in rollup} if rollup is not None else None,
+        "watermark": meta["watermark"],
+        "version": meta["version"],
+        "synced_at": now,
+        "full_at": now - (time.time() - meta["full_at"]),
+    }
+
+def _refresh_replica(table):
+    _sync(table, force=True)
+
+def refresh_in_background(table, run_now=True):
+    """Keep the replica of `table` synced by the scheduler every SYNC_MIN_INTERVAL."""
+    register_refresh(("sync", table), partial(_refresh_replica, table), SYNC_MIN_INTERVAL, run_now)
+
+def _sync(table, full=False, force=False):
+    col = WATERMARK_COLS.get(table)
+    now = time.monotonic()
+    with _sync_lock:
+        state = _synced.get(table)
+        pending = _pending_writes.pop(table, _NO_WRITES)
+    if (state and not (full or force) and pending is _NO_WRITES
+            and now - state["synced_at"] < SYNC_MIN_INTERVAL):
+        perf.annotate(mode="cached")
+        return state["frame"]
+
+    watermark = state["watermark"] if state else None
+    if pending is not _NO_WRITES and watermark is not None:
+        watermark = None if pending is None else min(watermark, pending)
+    try:
+        if (full or state is None or watermark is None
+                or now - state["full_at"] >= SYNC_FULL_INTERVAL):
+            perf.annotate(mode="full")
+            frame = fetch_table(table, ttl=0)
+            new_state = _commit(table, frame=frame, watermark=_watermark(frame, col),
+                                synced_at=now, full_at=now)
+            changed = True
+        else:
+            perf.annotate(mode="delta")
+            delta = fetch_table(table, filters=make_filters(col, watermark), ttl=0)
+            marks = [m for m in (state["watermark"], _watermark(delta, col)) if m is not None]
+            new_state = _commit(table, delta=delta, watermark=max(marks, default=None),
+                                synced_at=now)
+            changed = not delta.empty
+    except Exception:
+        if pending is not _NO_WRITES:
+            _note_write(table, [{}] if pending is None else [{col: pending}])
+        raise
+    if changed:
+        _save_snapshot(table, new_state)
+    return new_state["frame"]
+
+def sync_table(table, full=False):
+    """Return the full contents of `table` from its local replica.
+
+    Once a replica exists it is served as-is and the scheduler brings it up
+    to date in the background (delta reads every SYNC_MIN_INTERVAL, a full
+    read every SYNC_FULL_INTERVAL). A cold process serves the on-disk
+    snapshot; only a table with neither, `full`, or one this process has
+    written to since its last sync is read in the foreground.
+    """
+    with perf.span("sync_table", table=table) as rec:
+        with _sync_lock:
+            state = _synced.get(table)
+            written = table in _pending_writes
+        frame = None
+        if state is not None and not (full or written):
+            rec["mode"] = "cached"
+            frame = state["frame"]
+        elif state is None and not full:
+            snap = load_snapshot(table)
+            if snap is not None:
+                _commit(table, if_absent=True, **snap)
+                rec["mode"] = "snapshot"
+                frame = snap["frame"]
+        # A snapshot may be stale, and so may a cached frame whose refresh job
+        # was dropped while the table went unread (REFRESH_IDLE_TIMEOUT)
+        with _jobs_lock:
+            dropped = ("sync", table) not in _jobs
+        refresh_in_background(table, run_now=rec.get("mode") == "snapshot"
+                              or (rec.get("mode") == "cached" and dropped))
+        if frame is None:
+            frame = _sync(table, full)
+        rec["rows"] = len(frame)
+    return frame.copy()
+
+def sync_tables(tables, max_workers=6):
+    """sync_table for several tables at once; returns (frames, errors) like fetch_tables."""
+    return fetch_tables({t: t for t in tables}, max_workers, loader=sync_table)
+
+def filter_frame(df, filters):
+    """Apply a make_filters() spec to an already-loaded DataFrame."""
+    if df.empty or not filters:
+        return df
+    mask = pd.Series(True, index=df.index)
+    date_col = filters.get("date_col")
+    if date_col:
+        col = df[date_col]
+        bound = pd.Timestamp if pd.api.types.is_datetime64_any_dtype(col) else str
+        if bound is str:
+            col = col.astype(str)
+        if filters.get("start") is not None:
+            mask &= col >= bound(str(filters["start"]))
+        if filters.get("end") is not None:
+            mask &= col <= bound(str(filters["end"]))
+    if filters.get("brands") is not None:
+        mask &= df["brand"].isin(list(filters["brands"]))
+    return df[mask].reset_index(drop=True)
+
+# ---- KPI ROLLUPS ----
+# Per brand and period ("all", "month", "week" — weeks start Monday), kept in
+# step with the replica by _commit: running sums plus the latest value of
+# each metric. KPI cards read these few rows instead of scanning history.
+ROLLUP_METRICS = {
+    "ga_traffic":     {"sum": ["users"], "last": ["users"]},
+    "ads_metrics":    {"sum": ["clicks", "impressions"], "last": ["clicks", "impressions"]},
+    "agent_postings": {"sum": [], "last": ["total_listings", "sale_listings",
+                                           "rent_listings", "auction_listings"]},
+    "google_index":   {"sum": [], "last": ["indexed"]},
+    "semrush_rank":   {"sum": [], "last": ["rank"]},
+    "bounce_rate":    {"sum": [], "last": ["bounce_rate"]},
+}
+_rollups = {}   # table -> {(brand, period, period_start): bucket dict}
+
+def _bucketed(df, table):
+    """One copy of each row per period bucket it falls in."""
+    d = pd.to_datetime(df[WATERMARK_COLS[table]], errors="coerce")
+    base = df.assign(_date=d.dt.strftime("%Y-%m-%d"))[d.notna()]
+    d = d[d.notna()]
+    return pd.concat([
+        base.assign(period="all", period_start=""),
+        base.assign(period="month", period_start=d.dt.to_period("M").dt.start_time.dt.strftime("%Y-%m-%d")),
+        base.assign(period="week", period_start=(d - pd.to_timedelta(d.dt.weekday, unit="D")).dt.strftime("%Y-%m-%d")),
+    ], ignore_index=True)
+
+def _rollup_apply(store, table, old, new):
+    """Move `store` (the rollup of `table`) from `old` rows to their replacement `new` rows."""
+    spec = ROLLUP_METRICS.get(table)
+    if not spec:
+        return
+    keys = ["brand", "period", "period_start"]
+    for df, sign in ((old, -1), (new, 1)):
+        if df.empty:
+            continue
+        b = _bucketed(df, table)
+        for c in spec["sum"] + spec["last"]:
+            b[c] = pd.to_numeric(b[c], errors="coerce") if c in b.columns else np.nan
+        # Plain dicts: per-bucket .at lookups dominated rebuilds of large tables
+        groups = b.groupby(keys, observed=True)
+        sums = groups[spec["sum"]].sum().to_dict("index")
+        counts = groups.size()
+        lasts = b.sort_values("_date").groupby(keys, observed=True).last().to_dict("index") \
+            if sign > 0 else None
+        for k, n in counts.items():
+            bucket = store.setdefault(k, {"rows": 0, "last_date": None,
+                                          **{f"sum_{m}": 0 for m in spec["sum"]},
+                                          **{f"last_{m}": None for m in spec["last"]}})
+            bucket["rows"] += sign * int(n)
+            for m in spec["sum"]:
+                bucket[f"sum_{m}"] += sign * sums[k][m]
+            if lasts is not None and (bucket["last_date"] is None
+                                      or lasts[k]["_date"] >= bucket["last_date"]):
+                last = lasts[k]
+                bucket["last_date"] = last["_date"]
+                for m in spec["last"]:
+                    bucket[f"last_{m}"] = last[m]
+
+def _rollup_build(table, frame):
+    """New rollup of `frame`; None for tables without ROLLUP_METRICS."""
+    if table not in ROLLUP_METRICS:
+        return None
+    store = {}
+    _rollup_apply(store, table, frame.iloc[:0], frame)
+    return store
+
+def get_rollup(table, period=None, brands=None):
+    """Rollup rows of `table` (brand, period, period_start, rows, sum_*, last_*).
+
+    Loaded with the table's snapshot, or built from the replica on first use
+    and after every full re-read and then saved with the snapshot;
+    maintained through delta syncs and writes in between.
+    """
+    while True:
+        with _sync_lock:
+            built = table in _rollups or table not in ROLLUP_METRICS
+            state = _synced.get(table)
+        if built or state is None:
+            break
+        rollup = _rollup_build(table, state["frame"])  # outside the lock, like _commit
+        with _sync_lock:
+            installed = _synced.get(table) is state and _rollups.setdefault(table, rollup) is rollup
+        if installed:
+            _save_snapshot(table, state)  # so the next cold start loads it
+    if not built:
+        sync_table(table)
+    with _sync_lock:
+        rows = [{"brand": k[0], "period": k[1], "period_start": k[2], **v}
+                for k, v in _rollups.get(table, {}).items()]
+    df = pd.DataFrame(rows)
+    if df.empty:
+        return df
+    if period:
+        df = df[df["period"] == period]
+    if brands is not None:
+        df = df[df["brand"].isin(list(brands))]
+    return df.sort_values(["brand", "period_start"]).reset_index(drop=True)
+
+def kpi_by_brand(table, metric, how, start, end, rows):
+    """Per-brand "sum" or "last" of `metric` over [start, end].
+
+    Whole weeks inside the range are read from the week rollup; only rows in
+    the partial weeks at either edge are taken from `rows` (the table already
+    filtered to the range and brands).
+    """
+    if rows.empty:
+        return pd.Series(dtype=float)
+    col = WATERMARK_COLS[table]
+    start, end = str(start), str(end)
+    weeks = get_rollup(table, "week", rows["brand"].unique())
+    if not weeks.empty:
+        week_end = (pd.to_datetime(weeks["period_start"]) + pd.Timedelta(days=6)).dt.strftime("%Y-%m-%d")
+        weeks = weeks[(weeks["period_start"] >= start) & (week_end <= end)]
+    d = pd.to_datetime(rows[col], errors="coerce")
+    row_week = (d - pd.to_timedelta(d.dt.weekday, unit="D")).dt.strftime("%Y-%m-%d")
+    covered = pd.MultiIndex.from_arrays([rows["brand"], row_week]).isin(
+        pd.MultiIndex.from_frame(weeks[["brand", "period_start"]]) if not weeks.empty
+        else pd.MultiIndex.from_arrays([[], []]))
+    edge = rows[~covered]
+
+    if how == "sum":
+        inner = weeks.groupby("brand", observed=True)[f"sum_{metric}"].sum() \
+            if not weeks.empty else pd.Series(dtype=float)
+        outer = pd.to_numeric(edge[metric], errors="coerce").groupby(edge["brand"], observed=True).sum()
+        return inner.add(outer, fill_value=0)
+    candidates = [f for f in (
+        weeks.rename(columns={"last_date": "_date", f"last_{metric}": metric}),
+        edge.assign(_date=edge[col].astype(str)),
+    ) if not f.empty]
+    candidates = pd.concat([f[["brand", "_date", metric]] for f in candidates], ignore_index=True)
+    return candidates.sort_values("_date").groupby("brand", observed=True)[metric].last()
+
+def apply_local_write(table, records):
+    """Fold rows just written by this process into the replica and its rollup."""
+    with _sync_lock:
+        if table not in _synced or table not in TABLE_KEYS:
+            return
+    delta = apply_schema(pd.DataFrame(records), table)
+    if set(TABLE_KEYS[table]) <= set(delta.columns):
+        _commit(table, delta=delta)
+
+# ---- SERVER-SIDE BUCKETS ----
+# Weekly/monthly Dashboard series aggregated in Postgres by the
+# <table>_buckets functions in sql/metric_buckets.sql (date_trunc, weeks
+# start Monday), so only the buckets are transferred. Until a function is
+# deployed the same buckets are built from the table's rows locally.
+BUCKET_AGGS = {   # table -> {output column: (aggregate, source column)}
+    "ads_metrics":    {"clicks": ("sum", "clicks"), "impressions": ("sum", "impressions")},
+    "agent_postings": {c: ("last", c) for c in ["total_listings", "sale_listings",
+                                                "rent_listings", "auction_listings"]},
+    "google_index":   {"indexed": ("last", "indexed")},
+    "semrush_rank":   {"rank": ("avg", "rank"), "best_rank": ("min", "rank")},
+}
+# PostgREST / Postgres "function does not exist"
+_MISSING_FUNCTION_CODES = {"PGRST202", "42883"}
+_missing_functions = {}    # function -> time found missing; asked again after SYNC_FULL_INTERVAL
+
+def bucket_frame(df, table, grain):
+    """Bucket rows of `table` by `grain` ("week"/"month") the way <table>_buckets does."""
+    spec = BUCKET_AGGS[table]
+    if df.empty:
+        return pd.DataFrame(columns=["brand", "date", *spec])
+    d = pd.to_datetime(df["date"], errors="coerce")
+    if grain == "month":
+        bucket = d.dt.to_period("M").dt.start_time
+    else:
+        bucket = (d - pd.to_timedelta(d.dt.weekday, unit="D")).dt.normalize()
+    groups = df.assign(_bucket=bucket).sort_values("date").groupby(["brand", "_bucket"], observed=True)
+    aggs = {"avg": "mean"}
+    out = groups.agg(**{c: (src, aggs.get(how, how)) for c, (how, src) in spec.items()})
+    return out.reset_index().rename(columns={"_bucket": "date"}).sort_values(["date", "brand"],
+                                                                             ignore_index=True)
+
+def _load_buckets(table, grain, start, end, brands):
+    params = {"grain": grain, "start_date": str(start), "end_date": str(end),
+              "brands": list(brands) if brands is not None else None}
+    data = get_supabase().rpc(f"{table}_buckets", params).execute().data
+    if not data:
+        return pd.DataFrame(columns=["brand", "date", *BUCKET_AGGS[table]])
+    return apply_schema(pd.DataFrame(data), table)
+
+def fetch_buckets(table, grain, start, end, brands=None, rows=None, ttl=CACHE_TTL):
+    """Per-brand `grain` series of the BUCKET_AGGS metrics of `table` over [start, end].
+
+    Aggregated by the database and cached per range and grain. If the
+    table's function is not deployed, `rows` (the table already filtered to
+    the range and brands; default: read from the replica) are bucketed here.
+    """
+    fn = f"{table}_buckets"
+    with perf.span("fetch_buckets", table=table, grain=grain) as rec:
+        df = None
+        if time.monotonic() - _missing_functions.get(fn, -SYNC_FULL_INTERVAL) >= SYNC_FULL_INTERVAL:
+            try:
+                df = cached_read(table, ("buckets", grain, str(start), str(end), brands),
+                                 partial(_load_buckets, table, grain, start, end, brands), ttl)
+                rec["mode"] = "database"
+            except APIError as e:
+                if getattr(e, "code", None) not in _MISSING_FUNCTION_CODES:
+                    raise
+                _missing_functions[fn] = time.monotonic()
+        if df is None:
+            rec["mode"] = "local"
+            if rows is None:
+                rows = filter_frame(sync_table(table), make_filters("date", start, end, brands))
+            df = bucket_frame(rows, table, grain)
+        rec["rows"] = len(df)
+    return df
+
+# ---- UPSERT ENGINE ----
+UPSERT_BATCH_SIZE = 500
+UPSERT_RETRIES = 3
+UPSERT_BACKOFF = 0.5     # seconds, doubled on every retry
+UPSERT_SPLIT_BUDGET = 64 # extra requests one call may spend isolating bad rows
+UPSERT_GROW_AFTER = 8    # full-size successes before a shrunk batch size doubles again
+
+# PostgREST/Postgres errors worth retrying as-is: connection, statement timeout
+_TRANSIENT_CODES = {"PGRST000", "PGRST001", "PGRST002", "PGRST003", "57014"}
+# Errors every batch would hit (auth, missing table/column/constraint): stop, don't split
+_FATAL_CODES = {"PGRST301", "PGRST302", "42501", "42P01", "42703", "42P10"}
+# The batch was too big (payload too large, statement timeout, program limit):
+# later batches shrink too
+_SIZE_CODES = {"413", "57014", "54000"}
+
+def _error_code(e):
+    code = getattr(e, "code", None)
+    return None if code is None else str(code)
+
+def _is_transient(e):
+    if isinstance(e, httpx.TransportError):
+        return True
+    return isinstance(e, APIError) and _error_code(e) in _TRANSIENT_CODES
+
+def _is_size_error(e):
+    return isinstance(e, httpx.TimeoutException) or _error_code(e) in _SIZE_CODES
+
+def _is_row_error(e):
+    """Data or constraint error (class 22/23) caused by particular rows of a batch."""
+    code = _error_code(e) or ""
+    return code[:2] in ("22", "23")
+
+def _show_api_error(e):
+    st.error("⚠️ Supabase APIError during UPSERT")
+    msg = getattr(e, "message", None) or str(e)
+    det = getattr(e, "details", None)
+    st.code(msg)
+    if det:
+        st.caption("Details:")
+        st.code(str(det))
+
+def _upsert_batch(sb, table, batch, conflict_cols, retries, backoff, ignore_duplicates=False):
+    """Send one batch, retrying transient errors with exponential backoff.
+
+    Returns (attempts, error) — error is None on success.
+    """
+    for attempt in range(retries + 1):
+        try:
+            with perf.span("upsert_batch", table=table, attempt=attempt + 1) as rec:
+                rec["rows"] = len(batch)
+                sb.table(table).upsert(
+                    batch,
+                    on_conflict=conflict_cols,
+                    returning="minimal",
+                    ignore_duplicates=ignore_duplicates
+                ).execute()
+            return attempt + 1, None
+        except Exception as e:
+            if not _is_transient(e) or attempt == retries:
+                return attempt + 1, e
+            time.sleep(backoff * 2 ** attempt)
+
+def upsert_rows(table, rows, conflict_cols, batch_size=UPSERT_BATCH_SIZE,
+                max_workers=1, retries=UPSERT_RETRIES, backoff=UPSERT_BACKOFF,
+                progress=True, raise_on_error=True, show_errors=True, ignore_duplicates=False):
+    """Perform UPSERT (insert or update) in batches with better error handling.
+
+    `rows` is a list of dicts or a DataFrame (converted column-wise). Rows go
+    out in batches of up to `batch_size`, `max_workers` at a time. Transient
+    errors are retried with backoff. A batch that was too large is split in
+    half and later batches shrink, growing back after successes; a batch
+    with bad rows (class 22/23 errors) is bisected on its own, within
+    UPSERT_SPLIT_BUDGET extra requests, so the good rows still land. Other
+    errors fail the batch as a whole. Returns a report of rows written,
+    retried (written after a retry or split, each counted once) and failed
+    plus one entry per batch sent; raises the first error if any rows
+    failed and `raise_on_error` is set. `show_errors=False` leaves reporting
+    the first error to the caller instead of showing it with st.error.
+    With `ignore_duplicates` rows whose key already exists are left as
+    stored (insert-only), whatever the caller believed existed.
+    """
+    t0 = time.perf_counter()
     sb = get_supabase()
 
     # Convert list → comma-separated string
     if isinstance(conflict_cols, (list, tuple)):
         conflict_cols = ",".join(conflict_cols)
 
-    clean_rows = [_to_jsonable(r) for r in rows]
+    if isinstance(rows, pd.DataFrame):
+        clean_rows = frame_to_records(rows)
+    else:
+        clean_rows = [_to_jsonable(r) for r in rows]
 
-    try:
-        return sb.table(table).upsert(
-            clean_rows,
-            on_conflict=conflict_cols,
-            returning="minimal"
-        ).execute()
-    except APIError as e:
-        st.error("⚠️ Supabase APIError during UPSERT")
-        msg = getattr(e, "message", None) or str(e)
-        det = getattr(e, "details", None)
-        st.code(msg)
-        if det:
-            st.caption("Details:")
-            st.code(str(det))
-        raise
+    total = len(clean_rows)
+    report = {"rows": total, "written": 0, "retried": 0, "failed": 0, "batches": []}
+    errors = []
+    size = max(1, batch_size)
+    split_budget = UPSERT_SPLIT_BUDGET
+    streak = 0            # successes at the current size since it last shrank
+    pending = []          # (start, rows, split) halves to send after a split
+    cursor = 0
+    bar = st.progress(0.0, text=f"Upserting {total} rows into {table}…") if progress and total > size else None
 
-def query_duplicates(table, keys_df, conflict_cols):
-    sb = get_supabase()
-    dups = []
-    if keys_df.empty:
-        return pd.DataFrame()
-    keys_df = keys_df.copy()
+    def _next_batch():
+        nonlocal cursor
+        if pending:
+            return pending.pop()
+        start, cursor = cursor, min(cursor + size, total)
+        return start, clean_rows[start:cursor], False
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        in_flight = {}
+        while in_flight or pending or cursor < total:
+            while len(in_flight) < max(1, max_workers) and (pending or cursor < total):
+                start, batch, split = _next_batch()
+                fut = perf.submit(pool, _upsert_batch, sb, table, batch, conflict_cols, retries, backoff,
+                                  ignore_duplicates)
+                in_flight[fut] = (start, batch, split)
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                start, batch, split = in_flight.pop(fut)
+                attempts, err = fut.result()
+                report["batches"].append({"start": start, "rows": len(batch),
+                                          "attempts": attempts, "error": err and str(err)})
+                if err is None:
+                    report["written"] += len(batch)
+                    # Counted once, in the batch that finally wrote the rows
+                    if attempts > 1 or split:
+                        report["retried"] += len(batch)
+                    if len(batch) >= size and size < batch_size:
+                        streak += 1
+                        if streak >= UPSERT_GROW_AFTER:
+                            size, streak = min(batch_size, size * 2), 0
+                elif _error_code(err) in _FATAL_CODES:
+                    report["failed"] += len(batch) + sum(len(b) for _, b, _ in pending) + total - cursor
+                    pending, cursor = [], total
+                    errors.append(err)
+                elif len(batch) > 1 and (_is_size_error(err)
+                                         or (_is_row_error(err) and split_budget > 0)):
+                    half = len(batch) // 2
+                    if _is_size_error(err):
+                        size, streak = max(1, min(size, half)), 0
+                    else:
+                        split_budget -= 2
+                    pending += [(start + half, batch[half:], True), (start, batch[:half], True)]
+                else:
+                    report["failed"] += len(batch)
+                    errors.append(err)
+            if bar:
+                bar.progress(min(1.0, (report["written"] + report["failed"]) / total))
+
+    if bar:
+        bar.empty()
+    perf.record("upsert_rows", time.perf_counter() - t0, table=table, rows=report["written"],
+                retried=report["retried"], failed=report["failed"])
+    if report["written"]:
+        _note_write(table, clean_rows)
+        _note_keys(table, [r for b in report["batches"] if b["error"] is None
+                           for r in clean_rows[b["start"]:b["start"] + b["rows"]]])
+        # Skipped duplicates keep their stored values; the next sync reads them back
+        if not report["failed"] and not ignore_duplicates:
+            apply_local_write(table, clean_rows)
+        invalidate_table(table)
+    if errors:
+        if show_errors and isinstance(errors[0], APIError):
+            _show_api_error(errors[0])
+        if raise_on_error:
+            raise errors[0]
+    return report
+
+DUP_CHUNK_SIZE = 500
+
+def _normalize_keys(df, conflict_cols):
+    """String-normalise conflict key columns (dates as YYYY-MM-DD) for comparison."""
+    df = df[conflict_cols].copy()
     for c in conflict_cols:
         if "date" in c.lower():
-            keys_df[c] = pd.to_datetime(keys_df[c], errors="coerce").dt.date.astype(str)
+            df[c] = pd.Series(_iso_dates(df[c]), index=df.index).fillna("NaT")
         else:
-            keys_df[c] = keys_df[c].astype(str)
-    for _, r in keys_df.iterrows():
-        f = sb.table(table).select("*")
-        for c in conflict_cols:
-            f = f.eq(c, str(r[c]))
-        res = f.execute()
-        if res.data:
-            dups.append(res.data[0])
-    return pd.DataFrame(dups)
+            df[c] = df[c].astype(str)
+    return df
+
+def query_duplicates(table, keys_df, conflict_cols, chunk_size=DUP_CHUNK_SIZE, stats=None, fresh=False):
+    """Return existing rows whose conflict key matches a row of `keys_df`.
+
+    Keys of a TABLE_KEYS table are first looked up in its key index, so an
+    upload without duplicates costs no request; matching rows come from the
+    local replica when there is one. Otherwise keys are sorted by their
+    first date column and checked `chunk_size` at a time with one brand in_
+    + date range query per chunk, and composite keys are matched locally.
+    With `fresh` the index and replica are skipped and stored rows are read
+    from Supabase, bypassing the read cache, for callers that compare
+    values. If `stats` is a dict it receives keys/queries/seconds.
+    """
+    t0 = time.perf_counter()
+    if keys_df.empty:
+        return pd.DataFrame()
+    keys_df = _normalize_keys(keys_df, conflict_cols).drop_duplicates()
+    range_col = next((c for c in conflict_cols if "date" in c.lower()), None)
+    if range_col:
+        keys_df = keys_df[keys_df[range_col] != "NaT"]
+    checked = len(keys_df)
+    if not fresh and _indexed(table, conflict_cols):
+        keys_df = keys_df[_key_mask(key_index(table), keys_df[TABLE_KEYS[table]])]
+        with _sync_lock:
+            replica = _synced.get(table)
+        if keys_df.empty or replica is not None:
+            existing = pd.DataFrame()
+            frame = replica["frame"] if replica is not None else existing
+            if not keys_df.empty and not frame.empty:
+                wanted = set(keys_df.itertuples(index=False, name=None))
+                existing = frame[_key_mask(wanted, _normalize_keys(frame, conflict_cols))]
+                existing = existing.reset_index(drop=True)
+            seconds = time.perf_counter() - t0
+            perf.record("query_duplicates", seconds, table=table, rows=checked, queries=0)
+            if stats is not None:
+                stats.update(keys=checked, queries=0, seconds=seconds)
+            return existing
+    if range_col:
+        keys_df = keys_df.sort_values(range_col)
+    wanted = set(keys_df.itertuples(index=False, name=None))
+
+    found = []
+    for i in range(0, len(keys_df), chunk_size):
+        chunk = keys_df.iloc[i:i + chunk_size]
+        filters = make_filters(
+            range_col,
+            chunk[range_col].iloc[0] if range_col else None,
+            chunk[range_col].iloc[-1] if range_col else None,
+            chunk["brand"].unique().tolist() if "brand" in chunk else None,
+        )
+        found.append(fetch_table(table, filters=filters, ttl=0 if fresh else CACHE_TTL))
+
+    existing = pd.concat(found, ignore_index=True) if found else pd.DataFrame()
+    if not existing.empty:
+        existing_keys = _normalize_keys(existing, conflict_cols)
+        # Adjacent chunks share their boundary date, so a row can come back twice
+        mask = _key_mask(wanted, existing_keys) & ~existing_keys.duplicated().to_numpy()
+        existing = existing[mask].reset_index(drop=True)
+    seconds = time.perf_counter() - t0
+    perf.record("query_duplicates", seconds, table=table, rows=checked, queries=len(found))
+    if stats is not None:
+        stats.update(keys=checked, queries=len(found), seconds=seconds)
+    return existing
+
+# ---- KEY INDEX ----
+# Every existing conflict key of a TABLE_KEYS table, normalised as in
+# _normalize_keys, held as a set so duplicate checks are local lookups.
+# Loaded once from the key columns alone, extended by upsert_rows and topped
+# up from the watermark by the scheduler every SYNC_MIN_INTERVAL; a full
+# re-read every SYNC_FULL_INTERVAL drops keys deleted elsewhere.
+_key_indexes = {}      # table -> {"keys", "written", "watermark", "full_at"}
+_key_lock = threading.Lock()
+
+def _indexed(table, conflict_cols):
+    """True if `conflict_cols` is the key of `table` in any order; index tuples are in TABLE_KEYS order."""
+    return sorted(TABLE_KEYS.get(table, [])) == sorted(conflict_cols)
+
+def _key_mask(keys, keys_df):
+    """Boolean mask of the rows of normalised `keys_df` found in `keys`."""
+    return np.fromiter((k in keys for k in keys_df.itertuples(index=False, name=None)),
+                       dtype=bool, count=len(keys_df))
+
+def _load_key_index(table):
+    key_cols = TABLE_KEYS[table]
+    col = WATERMARK_COLS.get(table)
+    cols = key_cols + [c for c in [col] if c and c not in key_cols]
+    now = time.monotonic()
+    with _key_lock:
+        state = _key_indexes.get(table)
+    if state is None or state["watermark"] is None or now - state["full_at"] >= SYNC_FULL_INTERVAL:
+        df = fetch_table(table, columns=cols, ttl=0)
+        keys = set(_normalize_keys(df, key_cols).itertuples(index=False, name=None)) if not df.empty else set()
+        with _key_lock:
+            # Keys written while the read was in flight may be missing from it
+            written = _key_indexes[table]["written"] if table in _key_indexes else set()
+            state = _key_indexes[table] = {"keys": keys | written, "written": set(),
+                                           "watermark": _watermark(df, col), "full_at": now}
+        return state
+    delta = fetch_table(table, columns=cols, filters=make_filters(col, state["watermark"]), ttl=0)
+    if not delta.empty:
+        with _key_lock:
+            state["keys"].update(_normalize_keys(delta, key_cols).itertuples(index=False, name=None))
+            state["watermark"] = max(state["watermark"], _watermark(delta, col))
+    return state
+
+def key_index(table):
+    """Set of existing conflict-key tuples of `table`; only the first call waits for Supabase."""
+    state, _ = read_refreshed(("keys", table), partial(_load_key_index, table), SYNC_MIN_INTERVAL)
+    return state["keys"]
+
+def existing_key_mask(table, df, conflict_cols):
+    """Boolean mask of the rows of `df` whose conflict key already exists in `table`."""
+    if df.empty:
+        return np.zeros(0, dtype=bool)
+    return _key_mask(key_index(table), _normalize_keys(df, conflict_cols)[TABLE_KEYS[table]])
+
+def _note_keys(table, records):
+    """Add the keys of rows just written to the table's key index, if loaded."""
+    with _key_lock:
+        state = _key_indexes.get(table)
+        if state is None or not records:
+            return
+        key_cols = TABLE_KEYS[table]
+        df = pd.DataFrame(records)
+        if not set(key_cols) <= set(df.columns):
+            return
+        keys = set(_normalize_keys(df, key_cols).itertuples(index=False, name=None))
+        state["keys"] |= keys
+        state["written"] |= keys
 
 # ---- CSV UPLOAD IMPORTER ----
+# Uploads above this size go through the streaming (chunked, preview-only) path
+STREAM_THRESHOLD_BYTES = 25 * 1024 * 1024
+CSV_CHUNK_ROWS = 50_000
+PREVIEW_ROWS = 200
+
+# CSV columns of each table and how to coerce them — shared by the Data Entry
+# uploaders and `python -m utils.ingest`; conflict keys come from TABLE_KEYS
+IMPORT_SPECS = {
+    "ga_traffic":     {"expected_cols": ["brand", "start_date", "end_date", "users"],
+                       "date_cols": ["start_date", "end_date"], "int_cols": ["users"]},
+    "ads_metrics":    {"expected_cols": ["brand", "date", "clicks", "impressions"],
+                       "date_cols": ["date"], "int_cols": ["clicks", "impressions"]},
+    "agent_postings": {"expected_cols": ["brand", "date", "total_listings", "sale_listings",
+                                         "rent_listings", "auction_listings"],
+                       "date_cols": ["date"],
+                       "int_cols": ["total_listings", "sale_listings", "rent_listings",
+                                    "auction_listings"]},
+    "google_index":   {"expected_cols": ["brand", "date", "indexed"],
+                       "date_cols": ["date"], "int_cols": ["indexed"]},
+    "semrush_rank":   {"expected_cols": ["brand", "date", "rank"],
+                       "date_cols": ["date"], "int_cols": ["rank"]},
+    "bounce_rate":    {"expected_cols": ["brand", "week_start", "week_end", "bounce_rate"],
+                       "date_cols": ["week_start", "week_end"], "int_cols": [],
+                       "float_cols": ["bounce_rate"]},
+}
+
+def import_spec(table):
+    """upload_edit_import_csv_supabase keyword arguments for `table`."""
+    return {**IMPORT_SPECS[table], "table_name": table, "conflict_cols": TABLE_KEYS[table]}
+
+def _coerce_frame(df, expected_cols, date_cols, int_cols, float_cols):
+    """Keep `expected_cols` and coerce date/int/float columns."""
+    df = df[expected_cols].copy()
+    for c in date_cols:
+        df[c] = pd.to_datetime(df[c], errors="coerce").dt.date
+    for c in int_cols:
+        df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0).astype(int)
+    for c in float_cols:
+        df[c] = pd.to_numeric(df[c], errors="coerce")
+    return df
+
+def _build_payload(df, int_cols, row_builder):
+    if row_builder is None:
+        # Editor-added rows can turn int columns into float/NaN; restore ints
+        return df.astype({c: "Int64" for c in int_cols})
+    return pd.DataFrame([row_builder(r) for _, r in df.iterrows()])
+
+def _skip_existing(payload, dups, key_cols):
+    """Drop payload rows whose conflict key is already in `dups`."""
+    if dups.empty:
+        return payload
+    existing = pd.MultiIndex.from_frame(_normalize_keys(dups, key_cols))
+    incoming = pd.MultiIndex.from_frame(_normalize_keys(payload, key_cols))
+    return payload[~incoming.isin(existing)]
+
+DIFF_LABELS = ("new", "changed", "unchanged")
+
+def _same_values(new, old):
+    """Element-wise equality of an incoming and a stored column (missing == missing)."""
+    if _is_date_column(new) or _is_date_column(old):
+        return np.asarray(_iso_dates(new), dtype=object) == np.asarray(_iso_dates(old), dtype=object)
+    if pd.api.types.is_numeric_dtype(new) or pd.api.types.is_numeric_dtype(old):
+        a = pd.to_numeric(new, errors="coerce").astype(float).to_numpy()
+        b = pd.to_numeric(old, errors="coerce").astype(float).to_numpy()
+        return (a == b) | (np.isnan(a) & np.isnan(b))
+    def text(s):
+        return s.astype(object).where(s.notna(), "").astype(str).to_numpy()
+    return text(new) == text(old)
+
+def diff_rows(payload, existing, key_cols):
+    """Label each payload row "new", "changed" or "unchanged" against stored rows.
+
+    `existing` holds the stored rows for the payload's keys (e.g. from
+    query_duplicates). Rows are matched on the normalised conflict key and
+    compared on the columns both frames have. Returns a Series aligned
+    with `payload`.
+    """
+    labels = pd.Series("new", index=payload.index, dtype=object)
+    if payload.empty or existing.empty:
+        return labels
+    incoming = pd.MultiIndex.from_frame(_normalize_keys(payload, key_cols))
+    stored = existing.set_index(pd.MultiIndex.from_frame(_normalize_keys(existing, key_cols)))
+    stored = stored[~stored.index.duplicated(keep="last")]
+    pos = stored.index.get_indexer(incoming)
+    found = pos >= 0
+    if not found.any():
+        return labels
+    rows, matched = payload[found], stored.iloc[pos[found]]
+    same = np.ones(len(rows), dtype=bool)
+    for c in payload.columns:
+        if c not in key_cols and c in stored.columns:
+            same &= _same_values(rows[c].reset_index(drop=True), matched[c].reset_index(drop=True))
+    labels[found] = np.where(same, "unchanged", "changed")
+    return labels
+
+def _diff_summary(counts):
+    return f"{counts['new']:,} new, {counts['changed']:,} changed, {counts['unchanged']:,} unchanged"
+
+def _finish_import(key, upload_count_key, msg, report):
+    """Show failures in place, or reset the uploader and rerun with `msg`."""
+    if report and report["retried"]:
+        msg += f" {report['retried']} rows needed a retry."
+    if report and report["failed"]:
+        # Keep the upload in place so the failed rows can be fixed and re-imported
+        st.error(f"❌ {report['failed']} of {report['rows']} rows failed to import "
+                 f"({report['written']} written, {report['retried']} retried).")
+        st.dataframe(pd.DataFrame(report["batches"]), hide_index=True, use_container_width=True)
+        return
+
+    # Bug 3 fix: reset uploader by incrementing its key
+    st.session_state[upload_count_key] += 1
+    # Bug 2 fix: store message in session state so it shows on same tab after rerun
+    st.session_state[f"{key}_import_msg"] = msg
+    st.rerun()
+
+def import_chunks(chunks, table_name, conflict_cols, expected_cols, date_cols, int_cols,
+                  float_cols=(), row_builder=None, mode="keep", dry_run=False, on_chunk=None):
+    """Coerce → dedup → upsert pipeline over raw CSV chunks (DataFrames).
+
+    `mode` is "keep" (skip rows whose key exists), "overwrite" or "diff"
+    (send only new and changed rows). With `dry_run` rows are classified
+    but nothing is written. `on_chunk(totals)` is called after each chunk.
+    Returns totals: read, skipped, new/changed/unchanged (diff mode), rows
+    sent, written, retried, failed and the failed batches.
+    """
+    key_cols = conflict_cols if isinstance(conflict_cols, list) else [c.strip() for c in conflict_cols.split(",")]
+    totals = {"read": 0, "skipped": 0, **dict.fromkeys(DIFF_LABELS, 0),
+              "rows": 0, "written": 0, "retried": 0, "failed": 0, "batches": []}
+    for chunk in chunks:
+        payload = _build_payload(
+            _coerce_frame(chunk, expected_cols, date_cols, int_cols, float_cols),
+            int_cols, row_builder
+        )
+        totals["read"] += len(payload)
+        if mode == "keep":
+            if _indexed(table_name, key_cols):
+                fresh = payload[~existing_key_mask(table_name, payload, key_cols)]
+            else:
+                fresh = _skip_existing(payload, query_duplicates(table_name, payload, key_cols), key_cols)
+            totals["skipped"] += len(payload) - len(fresh)
+            payload = fresh
+        elif mode == "diff":
+            labels = diff_rows(payload, query_duplicates(table_name, payload, key_cols, fresh=True), key_cols)
+            for label, n in labels.value_counts().items():
+                totals[label] += int(n)
+            totals["skipped"] += int((labels == "unchanged").sum())
+            payload = payload[labels != "unchanged"]
+        if not payload.empty:
+            totals["rows"] += len(payload)
+            if not dry_run:
+                report = upsert_rows(table_name, payload, conflict_cols, progress=False,
+                                     raise_on_error=False, show_errors=False,
+                                     ignore_duplicates=mode == "keep")
+                for k in ("written", "retried", "failed"):
+                    totals[k] += report[k]
+                totals["batches"] += [b for b in report["batches"] if b["error"]]
+        if on_chunk:
+            on_chunk(totals)
+    return totals
+
+def _stream_import_csv(up, key, upload_count_key, expected_cols, date_cols, int_cols,
+                       float_cols, table_name, conflict_cols, row_builder):
+    """Chunked parse → coerce → dedup → upsert pipeline for large uploads.
+
+    Only one CSV_CHUNK_ROWS chunk is held as a DataFrame at a time; the edit
+    step becomes a read-only preview of the first PREVIEW_ROWS rows.
+    """
+    try:
+        preview = pd.read_csv(up, nrows=PREVIEW_ROWS)
+    except Exception as e:
+        st.error(f"Error reading CSV: {e}")
+        return
+    missing = [c for c in expected_cols if c not in preview.columns]
+    if missing:
+        st.error(f"Missing columns: {missing}")
+        return
+
+    st.info(f"Large file ({up.size / 1024 / 1024:.0f} MB) — streaming import. "
+            f"Showing the first {PREVIEW_ROWS} rows; cells can't be edited.")
+    st.dataframe(_coerce_frame(preview, expected_cols, date_cols, int_cols, float_cols),
+                 use_container_width=True, hide_index=True)
+    choice = st.radio("If a row already exists in the database:",
+                      ["Keep database values (skip)", "Overwrite existing",
+                       "Write only new and changed rows"],
+                      key=f"{key}_dup_choice")
+    mode = "keep" if "Keep" in choice else "diff" if "changed" in choice else "overwrite"
+
+    if not st.button("📥 Import to Supabase", key=f"{key}_import"):
+        return
+
+    bar = st.progress(0.0, text=f"Importing {table_name}…")
+    up.seek(0)
+    totals = import_chunks(
+        pd.read_csv(up, usecols=expected_cols, chunksize=CSV_CHUNK_ROWS),
+        table_name, conflict_cols, expected_cols, date_cols, int_cols, float_cols,
+        row_builder, mode,
+        on_chunk=lambda t: bar.progress(min(1.0, up.tell() / max(up.size, 1)),
+                                        text=f"Importing {table_name}… {t['written']:,} rows written")
+    )
+    bar.empty()
+
+    msg = f"✅ Imported {totals['written']:,} rows"
+    if mode == "keep":
+        msg += f" ({totals['skipped']:,} duplicates skipped)."
+    elif mode == "diff":
+        msg += f" ({_diff_summary(totals)} skipped)."
+    else:
+        msg += " (duplicates overwritten)."
+    _finish_import(key, upload_count_key, msg, totals)
+
 def upload_edit_import_csv_supabase(title, key, expected_cols, date_cols,
-                                    int_cols, table_name, conflict_cols, row_builder):
+                                    int_cols, table_name, conflict_cols, row_builder=None,
+                                    float_cols=()):
+    """CSV upload → edit → duplicate check → import for one table.
+
+    Without a `row_builder` the payload is built column-wise from
+    `expected_cols` and the date/int/float column lists; a `row_builder`
+    (row → dict) is still honoured for tables that need custom mapping.
+    Files over STREAM_THRESHOLD_BYTES are imported in streaming mode.
+    """
     st.subheader(title)
     # Bug 3 fix: dynamic uploader key — increments after import to clear stale file
     upload_count_key = f"{key}_upload_count"
@@ -147,6 +1613,10 @@ def upload_edit_import_csv_supabase(title, key, expected_cols, date_cols,
     up = st.file_uploader(f"Upload {table_name} CSV", type=["csv"], key=uploader_key)
     if up is None:
         return
+    if up.size > STREAM_THRESHOLD_BYTES:
+        _stream_import_csv(up, key, upload_count_key, expected_cols, date_cols, int_cols,
+                           float_cols, table_name, conflict_cols, row_builder)
+        return
     try:
         df = pd.read_csv(up)
     except Exception as e:
@@ -158,59 +1628,74 @@ def upload_edit_import_csv_supabase(title, key, expected_cols, date_cols,
         st.error(f"Missing columns: {missing}")
         return
 
-    df = df[expected_cols]
-    for c in date_cols:
-        df[c] = pd.to_datetime(df[c], errors="coerce").dt.date
-    for c in int_cols:
-        df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0).astype(int)
+    df = _coerce_frame(df, expected_cols, date_cols, int_cols, float_cols)
 
     st.caption("Edit cells before importing:")
     edited = st.data_editor(df, use_container_width=True, hide_index=True, num_rows="dynamic")
 
     try:
-        dups = query_duplicates(table_name, edited[conflict_cols], conflict_cols)
+        dup_stats = {}
+        dups = query_duplicates(table_name, edited[conflict_cols], conflict_cols, stats=dup_stats)
         has_dups = not dups.empty
+        if has_dups:
+            # Values shown and diffed must be the stored ones, not the local replica's
+            fresh_stats = {}
+            dups = query_duplicates(table_name, dups[conflict_cols], conflict_cols,
+                                    stats=fresh_stats, fresh=True)
+            has_dups = not dups.empty
+            dup_stats["queries"] += fresh_stats.get("queries", 0)
+            dup_stats["seconds"] += fresh_stats.get("seconds", 0.0)
+        if dup_stats:
+            st.caption(f"Duplicate check: {dup_stats['keys']} keys, {dup_stats['queries']} "
+                       f"queries, {dup_stats['seconds']:.2f}s")
     except Exception as e:
         has_dups = False
         st.warning(f"Duplicate check skipped due to error: {e}")
 
+    payload = _build_payload(edited, int_cols, row_builder)
+    key_cols = conflict_cols if isinstance(conflict_cols, list) else [c.strip() for c in conflict_cols.split(",")]
     if has_dups:
+        labels = diff_rows(payload, dups, key_cols)
+        counts = {label: int((labels == label).sum()) for label in DIFF_LABELS}
         st.warning(f"{len(dups)} duplicate rows detected.")
+        st.caption(f"Compared with stored values: {_diff_summary(counts)}.")
         st.dataframe(dups, hide_index=True, use_container_width=True)
         choice = st.radio("Duplicates found – choose action:",
-                          ["Keep database values (skip)", "Overwrite existing"],
+                          ["Keep database values (skip)", "Overwrite existing",
+                           "Write only new and changed rows"],
                           key=f"{key}_dup_choice")
-        mode = "keep" if "Keep" in choice else "overwrite"
+        mode = "keep" if "Keep" in choice else "diff" if "changed" in choice else "overwrite"
     else:
-        mode = "overwrite"
+        mode = "new"
 
     if st.button("📥 Import to Supabase", key=f"{key}_import"):
-        rows = [row_builder(r) for _, r in edited.iterrows()]
-
-        if mode == "overwrite":
-            upsert_rows(table_name, rows, conflict_cols)
-            msg = f"✅ Imported {len(rows)} rows (duplicates overwritten)."
+        report = None
+        if mode == "new":
+            # The check is local, so insert-only: a row that exists after all is kept
+            report = upsert_rows(table_name, payload, conflict_cols, raise_on_error=False,
+                                 ignore_duplicates=True)
+            msg = f"✅ Imported {report['written']} rows."
+        elif mode == "overwrite":
+            report = upsert_rows(table_name, payload, conflict_cols, raise_on_error=False)
+            msg = f"✅ Imported {report['written']} rows (duplicates overwritten)."
+        elif mode == "diff":
+            changed = payload[labels != "unchanged"]
+            if not changed.empty:
+                report = upsert_rows(table_name, changed, conflict_cols, raise_on_error=False)
+            written = report["written"] if report else 0
+            msg = f"✅ Imported {written} rows ({_diff_summary(counts)} skipped)."
         else:
             if has_dups:
-                key_cols = conflict_cols if isinstance(conflict_cols, list) else [c.strip() for c in conflict_cols.split(",")]
-                existing = {tuple(str(d[k]) for k in key_cols) for d in dups.to_dict(orient="records")}
-                new_rows = []
-                for i, r in enumerate(rows):
-                    r_clean = _to_jsonable(r)
-                    comp_key = tuple(str(r_clean[k]) for k in key_cols)
-                    if comp_key not in existing:
-                        new_rows.append(r)
-                if new_rows:
-                    upsert_rows(table_name, new_rows, conflict_cols)
-                msg = f"✅ Imported {len(new_rows)} new rows (duplicates skipped)."
+                new_rows = _skip_existing(payload, dups, key_cols)
+                if not new_rows.empty:
+                    report = upsert_rows(table_name, new_rows, conflict_cols, raise_on_error=False,
+                                         ignore_duplicates=True)
+                written = report["written"] if report else 0
+                msg = f"✅ Imported {written} new rows (duplicates skipped)."
             else:
                 msg = "ℹ️ No duplicates detected; nothing to skip."
 
-        # Bug 3 fix: reset uploader by incrementing its key
-        st.session_state[upload_count_key] += 1
-        # Bug 2 fix: store message in session state so it shows on same tab after rerun
-        st.session_state[f"{key}_import_msg"] = msg
-        st.rerun()
+        _finish_import(key, upload_count_key, msg, report)
 
     # Show import result after rerun — stays on current tab, no jump
     if f"{key}_import_msg" in st.session_state:
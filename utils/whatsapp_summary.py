@@ -0,0 +1,104 @@
+"""Rendering engine for the WhatsApp Blast summary blocks.
+
+Each section's lines are built for every brand at once from whole columns
+(dates formatted once per distinct value), and finished blocks are cached by
+brand, LATEST_N and a fingerprint of the data, so a rerun or a refresh that
+brought no new rows renders nothing.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Section title, table, sort column, line template. Template parts are
+# literal strings or (column, kind) with kind "date", "int" or "pct".
+SECTIONS = [
+    ("Google Analytics", "ga_traffic", "end_date",
+     [("start_date", "date"), "–", ("end_date", "date"), ": ", ("users", "int")]),
+    ("Google Ads", "ads_metrics", "date",
+     [("date", "date"), ": [", ("clicks", "int"), ",", ("impressions", "int"), "]"]),
+    ("Agent Postings", "agent_postings", "date",
+     [("date", "date"), ": ", ("total_listings", "int"), " [", ("sale_listings", "int"), ",",
+      ("rent_listings", "int"), ",", ("auction_listings", "int"), "]"]),
+    ("Google Index", "google_index", "date",
+     [("date", "date"), ": ", ("indexed", "int")]),
+    ("Bounce Rate", "bounce_rate", "week_start",
+     [("week_start", "date"), "–", ("week_end", "date"), ": ", ("bounce_rate", "pct")]),
+]
+SEPARATOR = "-" * 20
+CACHE_MAX_ENTRIES = 256
+
+_cache = OrderedDict()     # (brand, latest_n, version) -> block text
+_lock = threading.Lock()
+
+def data_version(frames):
+    """Fingerprint of the section tables in `frames`; equal data gives an equal version."""
+    return tuple(
+        int(pd.util.hash_pandas_object(frames[table], index=False).sum())
+        if table in frames and not frames[table].empty else 0
+        for _, table, _, _ in SECTIONS
+    )
+
+def _column_text(s, kind):
+    if kind == "date":
+        codes, uniques = pd.factorize(pd.to_datetime(s))
+        labels = np.append(np.asarray(uniques.strftime("%d/%m/%Y"), dtype=object), "")
+        return pd.Series(labels[codes], index=s.index)  # code -1 (missing) -> ""
+    if kind == "int":
+        return pd.to_numeric(s).round().astype("Int64").astype(str)
+    return pd.to_numeric(s).astype(float).map("{:.2f}%".format)
+
+def render_lines(df, template):
+    """One formatted line per row of `df`, built column by column."""
+    out = pd.Series("", index=df.index, dtype=object)
+    for part in template:
+        out = out + (part if isinstance(part, str) else _column_text(df[part[0]], part[1]))
+    return out
+
+def _render(frames, brands):
+    lines = []
+    for _, table, order, template in SECTIONS:
+        df = frames.get(table)
+        if df is None or df.empty:
+            lines.append({})
+            continue
+        df = df[df["brand"].isin(brands)].sort_values(order, kind="stable")
+        text = render_lines(df, template)
+        lines.append(text.groupby(df["brand"].astype(str), sort=False).agg(list).to_dict())
+
+    blocks = {}
+    for brand in brands:
+        block = [SEPARATOR, brand, SEPARATOR]
+        for i, (title, _, _, _) in enumerate(SECTIONS):
+            rows = lines[i].get(brand)
+            if not rows:
+                continue
+            if i:
+                block.append("")
+            block.append(f"*{title}*:")
+            block += rows
+        blocks[brand] = "\n".join(block)
+    return blocks
+
+def render_blocks(frames, brands, latest_n):
+    """Summary text per brand for `frames` (table -> latest rows per brand)."""
+    version = data_version(frames)
+    blocks, missing = {}, []
+    with _lock:
+        for brand in brands:
+            hit = _cache.get((brand, latest_n, version))
+            if hit is None:
+                missing.append(brand)
+            else:
+                _cache.move_to_end((brand, latest_n, version))
+                blocks[brand] = hit
+    if missing:
+        rendered = _render(frames, missing)
+        with _lock:
+            for brand, text in rendered.items():
+                _cache[(brand, latest_n, version)] = text
+            while len(_cache) > CACHE_MAX_ENTRIES:
+                _cache.popitem(last=False)
+        blocks.update(rendered)
+    return {brand: blocks[brand] for brand in brands}